@@ -0,0 +1,8 @@
+from celery_tasks.main import celery_app
+
+
+@celery_app.task(name='fill_captcha_pool')
+def fill_captcha_pool():
+    # 在任务中导入, 保证worker中django已经完成初始化
+    from verifications.captcha_pool import fill_captcha_pool
+    fill_captcha_pool()
@@ -1,2 +1,36 @@
 # 指定中间人/仓库位置
-broker_url = 'redis://127.0.0.1:6379/7'
\ No newline at end of file
+broker_url = 'redis://127.0.0.1:6379/7'
+
+# 定时任务 celery -A celery_tasks.main beat
+beat_schedule = {
+    # 每1分钟把redis中的类别访问量写入数据库
+    'flush-category-visits': {
+        'task': 'flush_category_visits',
+        'schedule': 60.0,
+    },
+    # redis预扣库存模式: 每5秒把redis中的库存扣减量同步到数据库
+    'reconcile-stock': {
+        'task': 'reconcile_stock',
+        'schedule': 5.0,
+    },
+    # 每1分钟取消超时未支付的订单并还回库存
+    'cancel-expired-orders': {
+        'task': 'cancel_expired_orders',
+        'schedule': 60.0,
+    },
+    # 异步下单: 每10秒检查一次下单队列, 防止触发任务丢失时请求一直排队
+    'drain-order-queue': {
+        'task': 'drain_order_queue',
+        'schedule': 10.0,
+    },
+    # 每10秒处理一次支付入账队列, 防止触发任务丢失时支付结果一直未入账
+    'settle-payments': {
+        'task': 'settle_payments',
+        'schedule': 10.0,
+    },
+    # 每30秒补充一次预生成的图形验证码
+    'fill-captcha-pool': {
+        'task': 'fill_captcha_pool',
+        'schedule': 30.0,
+    },
+}
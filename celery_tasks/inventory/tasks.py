@@ -0,0 +1,8 @@
+from celery_tasks.main import celery_app
+
+
+@celery_app.task(name='reconcile_stock')
+def reconcile_stock():
+    # 在任务中导入, 保证worker中django已经完成初始化
+    from orders.inventory import reconcile_stock
+    reconcile_stock()
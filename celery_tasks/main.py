@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_shutdown
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "meiduo_mall.settings.dev")
@@ -10,4 +11,12 @@ celery_app = Celery('meiduo')
 celery_app.config_from_object('celery_tasks.config')
 
 # 3.自定注册人物(当前只处理哪些任务）
-celery_app.autodiscover_tasks(['celery_tasks.sms', 'celery_tasks.email'])
+celery_app.autodiscover_tasks(['celery_tasks.sms', 'celery_tasks.email', 'celery_tasks.visit', 'celery_tasks.inventory',
+                               'celery_tasks.orders', 'celery_tasks.payment', 'celery_tasks.captcha'])
+
+
+@worker_process_shutdown.connect
+def release_order_id_lease(**kwargs):
+    # prefork的子进程用os._exit退出, 不会执行atexit, 在这里释放订单号机器号的租约
+    from orders.order_id import release_worker_lease
+    release_worker_lease()
@@ -0,0 +1,19 @@
+from celery_tasks.main import celery_app
+
+
+@celery_app.task(name='drain_order_queue')
+def drain_order_queue(shard=None):
+    # 在任务中导入, 保证worker中django已经完成初始化
+    from django.conf import settings
+    from orders.order_queue import drain_order_queue
+
+    # 不指定分片时处理所有分片, 用于定时兜底
+    shards = range(settings.ORDER_QUEUE_SHARDS) if shard is None else [shard]
+    for each in shards:
+        drain_order_queue(each)
+
+
+@celery_app.task(name='cancel_expired_orders')
+def cancel_expired_orders():
+    from orders.expiry import cancel_expired_orders
+    cancel_expired_orders()
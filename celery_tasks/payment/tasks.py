@@ -0,0 +1,9 @@
+from celery_tasks.main import celery_app
+
+
+@celery_app.task(name='settle_payments')
+def settle_payments():
+    # 在任务中导入, 保证worker中django已经完成初始化
+    from payment.settlement import settle_payments
+
+    settle_payments()
@@ -0,0 +1,8 @@
+from celery_tasks.main import celery_app
+
+
+@celery_app.task(name='flush_category_visits')
+def flush_category_visits():
+    # 在任务中导入, 保证worker中django已经完成初始化
+    from goods.utils import flush_category_visits
+    flush_category_visits()
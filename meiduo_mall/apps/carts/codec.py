@@ -0,0 +1,128 @@
+"""cookie购物车编解码
+
+格式: urlsafe_base64(版本号 + 商品数据 + 签名)
+版本号: 1个字节
+商品数据: 每个商品依次写入 varint(sku_id), varint(count << 1 | selected)
+签名: HMAC-SHA256(SECRET_KEY, 版本号 + 商品数据)的前8个字节
+
+{1: {'count': 2, 'selected': True}} -> 'AQEF...'
+"""
+import base64
+import hashlib
+import hmac
+import io
+import pickle
+
+from django.conf import settings
+
+CART_CODEC_VERSION = 1
+SIGNATURE_LENGTH = 8
+# 超过这个长度的cookie不做解析
+MAX_CART_COOKIE_LENGTH = 4096
+# 解码时丢弃数量不在1到这个值之间的商品
+MAX_CART_COUNT = 9999
+
+
+_hmac_cache = {}
+
+
+def _sign(data):
+    secret_key = settings.SECRET_KEY
+    base = _hmac_cache.get(secret_key)
+    if base is None:
+        # 预先处理好密钥的hmac对象, 每次签名时复制一份, 省去重复处理密钥
+        base = _hmac_cache[secret_key] = hmac.new(('carts:%s' % secret_key).encode(), digestmod=hashlib.sha256)
+    mac = base.copy()
+    mac.update(data)
+    return mac.digest()[:SIGNATURE_LENGTH]
+
+
+def _write_varint(buf, value):
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def encode_cart(cart_dict):
+    """把购物车字典编码成cookie字符串
+    :param cart_dict: {sku_id: {'count': 1, 'selected': True}}
+    """
+    buf = bytearray([CART_CODEC_VERSION])
+    for sku_id, sku_dict in cart_dict.items():
+        sku_id = int(sku_id)
+        count = int(sku_dict['count'])
+        if sku_id < 0 or count < 0:
+            raise ValueError('sku_id和count不能为负数')
+        _write_varint(buf, sku_id)
+        _write_varint(buf, count << 1 | bool(sku_dict['selected']))
+    buf.extend(_sign(bytes(buf)))
+    return base64.urlsafe_b64encode(bytes(buf)).rstrip(b'=').decode()
+
+
+def _decode_v1(data):
+    body, signature = data[:-SIGNATURE_LENGTH], data[-SIGNATURE_LENGTH:]
+    if not hmac.compare_digest(_sign(body), signature):
+        return {}
+
+    # 依次读出所有varint
+    values = []
+    value = shift = 0
+    for byte in body[1:]:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    if shift or len(values) % 2:
+        return {}
+
+    cart_dict = {}
+    for i in range(0, len(values), 2):
+        count = values[i + 1] >> 1
+        if 1 <= count <= MAX_CART_COUNT:
+            cart_dict[values[i]] = {'count': count, 'selected': bool(values[i + 1] & 1)}
+    return cart_dict
+
+
+class _CartUnpickler(pickle.Unpickler):
+    """只允许还原基本类型, 拒绝任何类和函数"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError('不允许的类型 %s.%s' % (module, name))
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _decode_legacy_pickle(cart_str):
+    """兼容旧版base64(pickle)格式的cookie, 迁移期间使用"""
+    cart = _CartUnpickler(io.BytesIO(base64.b64decode(cart_str.encode()))).load()
+    if not isinstance(cart, dict):
+        return {}
+
+    # 旧cookie没有签名, 逐个校验, 丢弃无效的商品, 否则重新编码时会出错
+    cart_dict = {}
+    for sku_id, sku_dict in cart.items():
+        if not _is_int(sku_id) or sku_id < 0 or not isinstance(sku_dict, dict):
+            continue
+        count = sku_dict.get('count')
+        if not _is_int(count) or not 1 <= count <= MAX_CART_COUNT:
+            continue
+        cart_dict[sku_id] = {'count': count, 'selected': bool(sku_dict.get('selected'))}
+    return cart_dict
+
+
+def decode_cart(cart_str):
+    """把cookie字符串解码成购物车字典, 数据无效或签名不对时返回空字典"""
+    if not cart_str or len(cart_str) > MAX_CART_COOKIE_LENGTH:
+        return {}
+    try:
+        data = base64.urlsafe_b64decode(cart_str.encode() + b'=' * (-len(cart_str) % 4))
+        if len(data) > SIGNATURE_LENGTH and data[0] == CART_CODEC_VERSION:
+            return _decode_v1(data)
+        return _decode_legacy_pickle(cart_str)
+    except Exception:
+        return {}
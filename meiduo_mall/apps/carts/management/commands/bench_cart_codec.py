@@ -0,0 +1,42 @@
+import base64
+import pickle
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from carts.codec import encode_cart, decode_cart
+
+
+def _pickle_encode(cart_dict):
+    return base64.b64encode(pickle.dumps(cart_dict)).decode()
+
+
+def _pickle_decode(cart_str):
+    return pickle.loads(base64.b64decode(cart_str.encode()))
+
+
+class Command(BaseCommand):
+    help = '对比cookie购物车新旧两种编码的大小和解码耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=10000, help='每种情况解码的次数')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        self.stdout.write('%6s %12s %12s %14s %14s' % ('items', 'pickle(B)', 'codec(B)', 'pickle(us)', 'codec(us)'))
+
+        for item_count in [1, 5, 20, 50]:
+            sku_ids = random.sample(range(1, 100000), item_count)
+            cart_dict = {sku_id: {'count': random.randint(1, 20), 'selected': random.random() < 0.5}
+                         for sku_id in sku_ids}
+
+            pickle_str = _pickle_encode(cart_dict)
+            codec_str = encode_cart(cart_dict)
+            assert decode_cart(codec_str) == cart_dict
+            assert decode_cart(pickle_str) == cart_dict
+
+            pickle_us = timeit.timeit(lambda: _pickle_decode(pickle_str), number=number) / number * 1e6
+            codec_us = timeit.timeit(lambda: decode_cart(codec_str), number=number) / number * 1e6
+            self.stdout.write('%6d %12d %12d %14.2f %14.2f' % (
+                item_count, len(pickle_str), len(codec_str), pickle_us, codec_us))
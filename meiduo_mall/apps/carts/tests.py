@@ -1,3 +1,51 @@
-from django.test import TestCase
+import base64
+import pickle
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from .codec import MAX_CART_COUNT, decode_cart, encode_cart
+
+
+def _legacy_cookie(cart_dict):
+    """旧版 base64(pickle) 格式的cookie"""
+    return base64.b64encode(pickle.dumps(cart_dict)).decode()
+
+
+@override_settings(SECRET_KEY='carts-test')
+class CartCodecTest(SimpleTestCase):
+
+    def test_round_trip(self):
+        cart_dict = {1: {'count': 2, 'selected': True}, 300: {'count': 1, 'selected': False}}
+        self.assertEqual(decode_cart(encode_cart(cart_dict)), cart_dict)
+
+    def test_tampered_cookie(self):
+        cookie = encode_cart({1: {'count': 2, 'selected': True}})
+        tampered = cookie[:-2] + ('AA' if cookie[-2:] != 'AA' else 'BB')
+        self.assertEqual(decode_cart(tampered), {})
+
+    def test_signed_cookie_drops_invalid_counts(self):
+        cookie = encode_cart({1: {'count': 0, 'selected': True}, 2: {'count': MAX_CART_COUNT + 1, 'selected': True},
+                              3: {'count': 5, 'selected': False}})
+        self.assertEqual(decode_cart(cookie), {3: {'count': 5, 'selected': False}})
+
+    def test_legacy_cookie(self):
+        cart_dict = {1: {'count': 2, 'selected': True}}
+        self.assertEqual(decode_cart(_legacy_cookie(cart_dict)), cart_dict)
+
+    def test_legacy_cookie_drops_invalid_items(self):
+        cookie = _legacy_cookie({
+            1: {'count': -3, 'selected': True},
+            2: {'count': 0, 'selected': True},
+            3: {'count': MAX_CART_COUNT + 1, 'selected': True},
+            4: {'count': '2', 'selected': True},
+            5: 'x',
+            -6: {'count': 1, 'selected': True},
+            7: {'count': 2, 'selected': False},
+        })
+        cart_dict = decode_cart(cookie)
+        self.assertEqual(cart_dict, {7: {'count': 2, 'selected': False}})
+        # 解码结果可以重新编码
+        self.assertEqual(decode_cart(encode_cart(cart_dict)), cart_dict)
+
+    def test_legacy_cookie_rejects_objects(self):
+        self.assertEqual(decode_cart(base64.b64encode(pickle.dumps({1: set()})).decode()), {})
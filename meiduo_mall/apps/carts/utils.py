@@ -1,6 +1,41 @@
-import pickle, base64
+from decimal import Decimal
+
+from django.conf import settings
 from django_redis import get_redis_connection
 
+from goods.sku_cache import get_sku_summaries
+from .codec import decode_cart
+
+# 合并策略: overwrite 以cookie中的数量为准, add 数量相加, max 取较大的数量
+CART_MERGE_POLICIES = ('overwrite', 'add', 'max')
+
+# 一次执行完所有商品和勾选状态的合并
+# KEYS[1]: carts_<user_id>  KEYS[2]: selected_<user_id>
+# ARGV[1]: 合并策略, 之后每3个一组: sku_id, count, selected(1/0)
+MERGE_CART_SCRIPT = """
+local policy = ARGV[1]
+for i = 2, #ARGV, 3 do
+    local sku_id = ARGV[i]
+    local count = tonumber(ARGV[i + 1])
+    if policy == 'add' then
+        redis.call('hincrby', KEYS[1], sku_id, count)
+    elseif policy == 'max' then
+        local origin_count = tonumber(redis.call('hget', KEYS[1], sku_id) or 0)
+        if count > origin_count then
+            redis.call('hset', KEYS[1], sku_id, count)
+        end
+    else
+        redis.call('hset', KEYS[1], sku_id, count)
+    end
+    if ARGV[i + 2] == '1' then
+        redis.call('sadd', KEYS[2], sku_id)
+    else
+        redis.call('srem', KEYS[2], sku_id)
+    end
+end
+return 1
+"""
+
 
 def merge_cart_cookie_to_redis(request, response):
 
@@ -8,14 +43,64 @@ def merge_cart_cookie_to_redis(request, response):
     user = request.user
     if cart_str is None:
         return
-    cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
+    cart_dict = decode_cart(cart_str)
+
+    if cart_dict:
+        policy = settings.CART_MERGE_POLICY
+        if policy not in CART_MERGE_POLICIES:
+            raise ValueError('不支持的购物车合并策略: %s' % policy)
+
+        args = [policy]
+        for sku_id, sku_dict in cart_dict.items():
+            args.extend([sku_id, sku_dict['count'], 1 if sku_dict['selected'] else 0])
+
+        # 所有商品在一次往返中原子地合并
+        redis_conn = get_redis_connection('carts')
+        merge_cart = redis_conn.register_script(MERGE_CART_SCRIPT)
+        merge_cart(keys=['carts_%s' % user.id, 'selected_%s' % user.id], args=args)
 
+    response.delete_cookie('carts')
+
+
+def get_redis_cart(user):
+    """一次往返读出登录用户的购物车
+    :return: {sku_id: {'count': 1, 'selected': True}}
+    """
     redis_conn = get_redis_connection('carts')
-    for sku_id, sku_dict in cart_dict.items():
-        redis_conn.hset('carts_%s' % user.id, sku_id, sku_dict['count'])
-        if sku_dict['selected']:
-            redis_conn.sadd('selected_%s' % user.id, sku_id)
-        else:
-            redis_conn.srem('selected_%s' % user.id, sku_id)
+    pl = redis_conn.pipeline(transaction=False)
+    pl.hgetall('carts_%s' % user.id)
+    pl.smembers('selected_%s' % user.id)
+    redis_dict, selected_ids = pl.execute()
+
+    cart_dict = {}
+    for sku_id_bytes in redis_dict:
+        cart_dict[int(sku_id_bytes)] = {
+            'count': int(redis_dict[sku_id_bytes]),
+            'selected': sku_id_bytes in selected_ids
+        }
+    return cart_dict
 
-    response.delete_cookie('carts')
\ No newline at end of file
+
+def get_cart_skus(cart_dict, selected_only=False):
+    """把购物车数据和sku摘要缓存合并成展示用的商品列表, 已不存在的sku会被忽略
+    :return: [{'id': 1, 'name': 'xx', 'price': Decimal, 'default_image_url': 'http://...',
+              'count': 1, 'selected': True, 'amount': Decimal}]
+    """
+    if selected_only:
+        cart_dict = {sku_id: sku_dict for sku_id, sku_dict in cart_dict.items() if sku_dict['selected']}
+    summaries = get_sku_summaries(cart_dict.keys())
+
+    cart_skus = []
+    for sku_id, sku_dict in cart_dict.items():
+        summary = summaries.get(sku_id)
+        if summary is None:
+            continue
+        price = Decimal(summary['price'])
+        cart_skus.append(dict(
+            summary,
+            price=price,
+            count=sku_dict['count'],
+            selected=sku_dict['selected'],
+            amount=price * sku_dict['count']
+        ))
+    return cart_skus
@@ -1,4 +1,4 @@
-import json, pickle, base64
+import json
 
 from django.shortcuts import render
 from django import http
@@ -7,6 +7,8 @@ from django_redis import get_redis_connection
 
 from goods.models import SKU
 from meiduo_mall.utils.response_code import RETCODE
+from .codec import encode_cart, decode_cart
+from .utils import get_redis_cart, get_cart_skus
 
 
 class CartsView(View):
@@ -26,6 +28,14 @@ class CartsView(View):
         except SKU.DoesNotExist:
             return http.HttpResponseForbidden('類型有誤')
 
+        try:
+            count = int(count)
+        except Exception:
+            return http.HttpResponseForbidden('類型有誤')
+        if count < 1:
+            return http.HttpResponseForbidden('類型有誤')
+        sku_id = sku.id
+
         user = request.user
         if user.is_authenticated:
 
@@ -50,13 +60,7 @@ class CartsView(View):
             }
             
             """
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                cart_str_bytes = cart_str.encode()
-                cart_bytes = base64.b64decode(cart_str_bytes)
-                cart_dict = pickle.loads(cart_bytes)
-            else:
-                cart_dict = {}
+            cart_dict = decode_cart(request.COOKIES.get('carts'))
             if sku_id in cart_dict:
                 origin_count = cart_dict[sku_id]['count']
                 count += origin_count
@@ -65,7 +69,7 @@ class CartsView(View):
                 'selected': selected
             }
 
-            cart_str = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cart_str = encode_cart(cart_dict)
             response = http.JsonResponse({'code': RETCODE.OK, 'errmsg': '添加购物车成功'})
             response.set_cookie('carts', cart_str)
             return response
@@ -85,36 +89,24 @@ class CartsView(View):
         """
         user = request.user
         if user.is_authenticated:
-            redis_conn = get_redis_connection('carts')
-            redis_dict = redis_conn.hgetall('carts_%s' % user.id)
-            selected_ids = redis_conn.smembers('selected_%s' % user.id)
-            cart_dict = {}
-            for sku_id_bytes in redis_dict:
-                cart_dict[int(sku_id_bytes)] = {
-                    'count': int(redis_dict[sku_id_bytes]),
-                    'selected': sku_id_bytes in selected_ids
-                }
+            cart_dict = get_redis_cart(user)
         else:
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
+            cart_dict = decode_cart(request.COOKIES.get('carts'))
+            if not cart_dict:
                 return render(request, 'cart.html')
 
-        sku_qs = SKU.objects.filter(id__in=cart_dict.keys())
+        # sku信息来自sku摘要缓存
         sku_list = []
-
-        for sku_model in sku_qs:
-            count = cart_dict[sku_model.id]['count']
+        for cart_sku in get_cart_skus(cart_dict):
             sku_list.append(
                 {
-                    'id': sku_model.id,
-                    'name': sku_model.name,
-                    'price': str(sku_model.price),
-                    'default_image_url': sku_model.default_image.url,
-                    'selected': str(cart_dict[sku_model.id]['selected']),
-                    'count': count,
-                    'amount': str(sku_model.price * count)
+                    'id': cart_sku['id'],
+                    'name': cart_sku['name'],
+                    'price': str(cart_sku['price']),
+                    'default_image_url': cart_sku['default_image_url'],
+                    'selected': str(cart_sku['selected']),
+                    'count': cart_sku['count'],
+                    'amount': str(cart_sku['amount'])
                 }
             )
         return render(request, 'cart.html', {'cart_skus': sku_list})
@@ -138,6 +130,9 @@ class CartsView(View):
             count = int(count)
         except Exception:
             return http.HttpResponseForbidden('类型有误')
+        if count < 1:
+            return http.HttpResponseForbidden('类型有误')
+        sku_id = sku_model.id
 
         if isinstance(selected, bool) is False:
             return http.HttpResponseForbidden('类型有误')
@@ -167,10 +162,8 @@ class CartsView(View):
             return response
 
         else:
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
+            cart_dict = decode_cart(request.COOKIES.get('carts'))
+            if not cart_dict:
                 return http.JsonResponse({'code': RETCODE.DBERR, 'errmsg': 'cookie数据没有获取到'})
             """
             {
@@ -181,7 +174,7 @@ class CartsView(View):
                 'count': count,
                 'selected': selected
             }
-            cart_str = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cart_str = encode_cart(cart_dict)
             cart_sku = {
                 'id': sku_model.id,
                 'name': sku_model.name,
@@ -203,6 +196,7 @@ class CartsView(View):
             sku = SKU.objects.get(id=sku_id)
         except SKU.DoesNotExist:
             return http.HttpResponseForbidden('sku_id无效')
+        sku_id = sku.id
         user = request.user
         if user.is_authenticated:
             redis_conn = get_redis_connection('carts')
@@ -212,10 +206,8 @@ class CartsView(View):
             pl.execute()
             return http.JsonResponse({'code': RETCODE.OK, 'errmsg': "删除购物车成功"})
         else:
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
+            cart_dict = decode_cart(request.COOKIES.get('carts'))
+            if not cart_dict:
                 return http.JsonResponse({'code': RETCODE.DBERR, 'errmsg': 'cookie数据没获取到'})
             if sku_id in cart_dict:
                 del cart_dict[sku_id]
@@ -224,7 +216,7 @@ class CartsView(View):
                 response.delete_cookie('carts')
                 return response
 
-            cart_str = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cart_str = encode_cart(cart_dict)
             response.set_cookie('carts', cart_str)
             return response
 
@@ -248,19 +240,12 @@ class CartsSelectedAllView(View):
                 redis_conn.delete('selected_%s' % user.id)
             return http.JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK'})
         else:
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
+            cart_dict = decode_cart(request.COOKIES.get('carts'))
+            if not cart_dict:
                 return http.JsonResponse({'code': RETCODE.DBERR, 'errmsg': 'cookie没有获取到'})
             for sku_id in cart_dict:
                 cart_dict[sku_id]['selected'] = selected
-            cart_str = base64.b64encode(pickle.dumps(cart_dict)).decode()
-            response = http.JsonResponse({'code': RETCODE.OK, 'errmsg': 'cookie没有获取到'})
-
-            for sku_id in cart_dict:
-                cart_dict[sku_id]['selected'] = selected
-            cart_str = base64.b64encode(pickle.dumps(cart_dict)).decode
+            cart_str = encode_cart(cart_dict)
             response = http.JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK'})
             response.set_cookie('carts', cart_str)
             return response
@@ -285,34 +270,19 @@ class CartsSimpleView(View):
         """
         user = request.user
         if user.is_authenticated:
-            redis_conn = get_redis_connection('carts')
-            redis_dict = redis_conn.hgetall('carts_%s' % user.id)
-            selected_ids = redis_conn.smembers('selected_%s' % user.id)
-
-            cart_dict = {}
-            for sku_id_bytes in redis_dict:
-                cart_dict[int(sku_id_bytes)] = {
-                    'count': int(redis_dict[sku_id_bytes]),
-                    'selected': sku_id_bytes in selected_ids
-                }
-
+            cart_dict = get_redis_cart(user)
         else:
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
-                return render(request, 'cart.html')
+            cart_dict = decode_cart(request.COOKIES.get('carts'))
 
-        sku_qs = SKU.objects.filter(id__in=cart_dict.keys())
+        # sku信息来自sku摘要缓存, 不查询数据库
         sku_list = []
-        for sku_model in sku_qs:
-            count = cart_dict[sku_model.id]['count']
+        for cart_sku in get_cart_skus(cart_dict):
             sku_list.append(
                 {
-                    'id': sku_model.id,
-                    'name': sku_model.name,
-                    'default_image_url': sku_model.default_image.url,
-                    'count': count,
+                    'id': cart_sku['id'],
+                    'name': cart_sku['name'],
+                    'default_image_url': cart_sku['default_image_url'],
+                    'count': cart_sku['count'],
                 }
             )
         return http.JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK', 'cart_skus': sku_list})
\ No newline at end of file
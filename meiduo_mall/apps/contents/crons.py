@@ -1,32 +1,41 @@
-import time, os
-from django.shortcuts import render
-from django.conf import settings
-
-from .utils import get_categories
-from .models import ContentCategory
+import logging
+import os
+import time
 
+from django.conf import settings
+from django.core.cache import cache
 
-def generate_static_index_html():
+from meiduo_mall.utils.static_file import write_static_file
+from .utils import (get_index_fingerprint, render_index_html, store_index_html, INDEX_HTML_KEY, INDEX_VERSION_KEY,
+                    INDEX_VERSION_EXPIRES)
 
-    print('%s: generate_static_index_html' % time.ctime())
+logger = logging.getLogger('django')
 
-    # 获取商品频道和分类
-    categories = get_categories()
+# 上次生成首页静态文件时的内容指纹
+INDEX_FINGERPRINT_KEY = 'index_fingerprint'
 
-    # 广告内容
-    contents = {}
-    content_categories = ContentCategory.objects.all()
-    for cat in content_categories:
-        contents[cat.key] = cat.content_set.filter(status=True).order_by('sequence')
 
-    # 渲染模板
-    context = {
-        'categories': categories,
-        'contents': contents
-    }
+def generate_static_index_html():
 
-    response = render(None, 'index.html', context)
-    html_text = response.content.decode()
+    start_time = time.time()
     file_path = os.path.join(settings.STATICFILES_DIRS[0], 'index.html')
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(html_text)
+
+    # 刷新首页内容版本, IndexView按这个版本读取缓存的首页html
+    fingerprint = get_index_fingerprint()
+    cache.set(INDEX_VERSION_KEY, fingerprint, INDEX_VERSION_EXPIRES)
+
+    # 内容没有变化时不重新生成
+    if fingerprint == cache.get(INDEX_FINGERPRINT_KEY) and os.path.exists(file_path):
+        logger.info('generate_static_index_html: 内容未变化, 跳过 (%.3fs)' % (time.time() - start_time))
+        return
+
+    # 不经过get_index_html的锁: 有请求正在渲染时它会返回上一版html, 写入文件后这一版就不会再生成了
+    html_text = cache.get(INDEX_HTML_KEY, version=fingerprint)
+    if html_text is None:
+        html_text = render_index_html()
+        store_index_html(fingerprint, html_text)
+    write_static_file(file_path, html_text)
+    # 这一版的html写入文件之后才记录指纹
+    cache.set(INDEX_FINGERPRINT_KEY, fingerprint, None)
+
+    logger.info('generate_static_index_html: 总耗时%.3fs' % (time.time() - start_time))
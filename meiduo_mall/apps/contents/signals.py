@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from goods.models import GoodsCategory, GoodsChannel
+from .utils import invalidate_categories
+
+
+@receiver([post_save, post_delete], sender=GoodsCategory)
+@receiver([post_save, post_delete], sender=GoodsChannel)
+def categories_changed(sender, **kwargs):
+    """商品分类或频道变化, 重建分类快照"""
+    invalidate_categories()
@@ -1,7 +1,43 @@
-from goods.models import GoodsChannel
+import logging
+import time
 
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.shortcuts import render
+from django_redis import get_redis_connection
 
-def get_categories():
+from goods.models import GoodsCategory, GoodsChannel
+from meiduo_mall.utils.cache import get_cache_version, incr_cache_version
+from .models import ContentCategory, Content
+
+logger = logging.getLogger('django')
+
+CATEGORIES_VERSION_KEY = 'categories_version'
+# 分类快照缓存有效期(秒), 分类或频道保存时靠版本号失效
+CATEGORIES_CACHE_EXPIRES = 3600 * 24
+
+# 当前的首页内容版本(内容指纹), 由定时任务刷新
+INDEX_VERSION_KEY = 'index_version'
+INDEX_VERSION_EXPIRES = 120
+# 渲染好的首页html, 以内容版本作为缓存版本号
+INDEX_HTML_KEY = 'index_html'
+INDEX_HTML_EXPIRES = 3600 * 24
+# 最近一次渲染的首页html, 重新渲染期间先返回它
+INDEX_HTML_LATEST_KEY = 'index_html_latest'
+# 首页重新渲染的锁, 同一时间只有一个进程在渲染
+INDEX_HTML_LOCK_EXPIRES = 10
+
+# 进程内的分类快照 (版本号, 分类数据)
+_local_snapshot = (None, None)
+
+
+def build_categories():
+    """两条查询加载全部分类和频道, 在内存中组装出频道分组数据"""
+    cat_dict = {}  # {category_id: category}
+    sub_cats_dict = {}  # {parent_id: [category, ...]}
+    for cat in GoodsCategory.objects.order_by('id'):
+        cat_dict[cat.id] = cat
+        sub_cats_dict.setdefault(cat.parent_id, []).append(cat)
 
     categories = {}
     good_channels_qs = GoodsChannel.objects.order_by('group_id', 'sequence')
@@ -12,14 +48,118 @@ def get_categories():
         if group_id not in categories:
             categories[group_id] = {'channels': [], 'sub_cats': []}
 
-        cat1 = channel.category
+        cat1 = cat_dict.get(channel.category_id)
+        if cat1 is None:
+            continue
         cat1.url = channel.url
         categories[group_id]['channels'].append(cat1)
 
-        cat2_qs = cat1.subs.all()
-        for cat2 in cat2_qs:
-            cat3_qs = cat2.subs.all()
-            cat2.sub_cats = cat3_qs
+        for cat2 in sub_cats_dict.get(cat1.id, []):
+            cat2.sub_cats = sub_cats_dict.get(cat2.id, [])
             categories[group_id]['sub_cats'].append(cat2)
 
-    return categories
\ No newline at end of file
+    return categories
+
+
+def get_categories():
+    """获取频道分类, 依次读取进程内快照、缓存快照, 都没有时重新构造"""
+    global _local_snapshot
+
+    version = get_cache_version(CATEGORIES_VERSION_KEY)
+    local_version, categories = _local_snapshot
+    if local_version == version:
+        return categories
+
+    categories = cache.get('categories', version=version)
+    if categories is None:
+        categories = build_categories()
+        cache.set('categories', categories, CATEGORIES_CACHE_EXPIRES, version=version)
+
+    _local_snapshot = (version, categories)
+    return categories
+
+
+def invalidate_categories():
+    """分类或频道保存后让所有进程的分类快照失效"""
+    incr_cache_version(CATEGORIES_VERSION_KEY)
+
+
+def get_index_fingerprint():
+    """首页内容指纹: 广告、广告类别、频道、商品分类的最后修改时间和数量, 数量用来发现删除"""
+    parts = []
+    for model in [Content, ContentCategory, GoodsChannel, GoodsCategory]:
+        result = model.objects.aggregate(last_update=Max('update_time'), count=Count('id'))
+        last_update = result['last_update']
+        parts.append('%s:%s' % (last_update.strftime('%Y%m%d%H%M%S%f') if last_update else 0, result['count']))
+    return '-'.join(parts)
+
+
+def get_index_version():
+    """读取当前首页内容版本, 定时任务没有刷新时自己计算"""
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        version = get_index_fingerprint()
+        cache.set(INDEX_VERSION_KEY, version, INDEX_VERSION_EXPIRES)
+    return version
+
+
+def render_index_html():
+    """渲染首页"""
+    start_time = time.time()
+
+    # 广告内容, 一次查出所有展示中的广告再按类别分组
+    content_dict = {}
+    for content in Content.objects.filter(status=True).order_by('sequence'):
+        content_dict.setdefault(content.category_id, []).append(content)
+
+    contents = {}
+    for cat in ContentCategory.objects.all():
+        contents[cat.key] = content_dict.get(cat.id, [])
+
+    context = {
+        'categories': get_categories(),
+        'contents': contents
+    }
+
+    response = render(None, 'index.html', context)
+    html_text = response.content.decode()
+    logger.info('render_index_html: 渲染%.3fs' % (time.time() - start_time))
+    return html_text
+
+
+def store_index_html(version, html_text):
+    """缓存某个内容版本的首页html, 同时作为最近一次渲染的html"""
+    cache.set(INDEX_HTML_KEY, html_text, INDEX_HTML_EXPIRES, version=version)
+    cache.set(INDEX_HTML_LATEST_KEY, html_text, None)
+
+
+def get_index_html(version=None):
+    """获取渲染好的首页html
+    缓存未命中时只有拿到锁的进程重新渲染, 其它进程先返回上一版html或等待渲染结果, 避免缓存失效时大量请求同时查库
+    """
+    version = version or get_index_version()
+    html_text = cache.get(INDEX_HTML_KEY, version=version)
+    if html_text is not None:
+        return html_text
+
+    redis_conn = get_redis_connection('default')
+    lock_key = 'index_html_lock_%s' % version
+    locked = redis_conn.set(lock_key, 1, nx=True, ex=INDEX_HTML_LOCK_EXPIRES)
+    if not locked:
+        html_text = cache.get(INDEX_HTML_LATEST_KEY)
+        if html_text is not None:
+            return html_text
+        # 还没有任何一版html时等待拿到锁的进程渲染完成, 超时后自己渲染
+        for _ in range(INDEX_HTML_LOCK_EXPIRES * 20):
+            time.sleep(0.05)
+            html_text = cache.get(INDEX_HTML_KEY, version=version)
+            if html_text is not None:
+                return html_text
+
+    try:
+        html_text = render_index_html()
+        store_index_html(version, html_text)
+    finally:
+        if locked:
+            redis_conn.delete(lock_key)
+    return html_text
@@ -0,0 +1,127 @@
+import datetime
+import os
+import time
+from multiprocessing import Pool
+
+from django import db
+from django.conf import settings
+from django.db.models import Max
+from django.shortcuts import render
+
+from meiduo_mall.utils.static_file import write_static_file
+from .models import (GoodsCategory, GoodsChannel, SKU, SKUImage, SKUSpecification, SPU, SPUSpecification,
+                     SpecificationOption)
+from .utils import get_detail_context
+
+# 静态详情页的保存目录
+DETAIL_HTML_DIR = os.path.join(settings.STATICFILES_DIRS[0], 'detail')
+# 记录上次生成的开始时间, 用来找出之后修改过的sku
+LAST_GENERATED_FILE = os.path.join(DETAIL_HTML_DIR, '.last_generated')
+# 每个子进程一次处理的sku数量
+CHUNK_SIZE = 50
+
+
+def _detail_html_path(sku_id):
+    return os.path.join(DETAIL_HTML_DIR, '%s.html' % sku_id)
+
+
+def _read_last_generated():
+    try:
+        with open(LAST_GENERATED_FILE) as f:
+            return float(f.read().strip())
+    except (IOError, ValueError):
+        return None
+
+
+def _write_last_generated(timestamp):
+    with open(LAST_GENERATED_FILE, 'w') as f:
+        f.write(str(timestamp))
+
+
+def get_changed_sku_ids(since):
+    """找出since之后sku、spu、规格、图片有修改的sku_id, 返回None表示需要全量生成"""
+    # 分类导航在每个详情页中都有, 分类或频道变化时全部重新生成
+    for model in [GoodsCategory, GoodsChannel]:
+        last_update = model.objects.aggregate(Max('update_time'))['update_time__max']
+        if last_update and last_update > since:
+            return None
+
+    sku_ids = set(SKU.objects.filter(update_time__gt=since).values_list('id', flat=True))
+    sku_ids.update(SKUSpecification.objects.filter(update_time__gt=since).values_list('sku_id', flat=True))
+    sku_ids.update(SKUImage.objects.filter(update_time__gt=since).values_list('sku_id', flat=True))
+
+    spu_ids = set(SPU.objects.filter(update_time__gt=since).values_list('id', flat=True))
+    spu_ids.update(SPUSpecification.objects.filter(update_time__gt=since).values_list('spu_id', flat=True))
+    spu_ids.update(SpecificationOption.objects.filter(update_time__gt=since).values_list('spec__spu_id', flat=True))
+    if spu_ids:
+        sku_ids.update(SKU.objects.filter(spu_id__in=spu_ids).values_list('id', flat=True))
+
+    return sku_ids
+
+
+def _render_detail_html(sku_ids):
+    """在子进程中生成一批sku的静态详情页, 下架的sku删除其静态页"""
+    sku_qs = SKU.objects.filter(id__in=sku_ids).select_related('category__parent__parent', 'spu')
+    count = 0
+    for sku in sku_qs:
+        file_path = _detail_html_path(sku.id)
+        if not sku.is_launched:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            continue
+
+        response = render(None, 'detail.html', get_detail_context(sku))
+        write_static_file(file_path, response.content.decode())
+        count += 1
+    return count
+
+
+def remove_deleted_detail_html():
+    """删除已经不存在的sku的静态详情页
+    :return: 删除的页面数
+    """
+    page_ids = {}
+    for name in os.listdir(DETAIL_HTML_DIR):
+        sku_id, ext = os.path.splitext(name)
+        if ext == '.html' and sku_id.isdigit():
+            page_ids[int(sku_id)] = name
+    if not page_ids:
+        return 0
+
+    existing = set(SKU.objects.filter(id__in=page_ids).values_list('id', flat=True))
+    count = 0
+    for sku_id, name in page_ids.items():
+        if sku_id not in existing:
+            os.remove(os.path.join(DETAIL_HTML_DIR, name))
+            count += 1
+    return count
+
+
+def generate_static_detail_html(full=False, processes=None):
+    """用进程池生成sku的静态详情页, 默认只生成上次之后有变化的sku
+    :return: (生成的页面数, 耗时秒数)
+    """
+    start_time = time.time()
+    os.makedirs(DETAIL_HTML_DIR, exist_ok=True)
+
+    last_generated = None if full else _read_last_generated()
+    sku_ids = None
+    if last_generated is not None:
+        sku_ids = get_changed_sku_ids(datetime.datetime.fromtimestamp(last_generated))
+    if sku_ids is None:
+        sku_ids = SKU.objects.values_list('id', flat=True)
+    sku_ids = sorted(sku_ids)
+
+    chunks = [sku_ids[i:i + CHUNK_SIZE] for i in range(0, len(sku_ids), CHUNK_SIZE)]
+    count = 0
+    if chunks:
+        # 子进程会复制父进程的数据库连接, 创建进程池之前先关闭
+        db.connections.close_all()
+        with Pool(processes) as pool:
+            count = sum(pool.map(_render_detail_html, chunks))
+
+    # 删除的sku不会出现在修改记录中, 每次都按静态页文件检查一遍
+    remove_deleted_detail_html()
+
+    _write_last_generated(start_time)
+    return count, time.time() - start_time
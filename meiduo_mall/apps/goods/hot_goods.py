@@ -0,0 +1,90 @@
+"""商品热销排行
+
+每个类别一个热销排行:
+hot_skus_<category_id>: zset {sku_id: 销量}
+hot_skus_built_<category_id>: 排行已建立的标记, 没有商品的类别也会有
+排行中的sku信息来自sku摘要缓存
+"""
+
+from django_redis import get_redis_connection
+
+from .models import SKU
+from .sku_cache import get_sku_summaries
+
+# 下单时只给已在排行中的sku累加销量, 排行不存在时不创建
+INCR_HOT_GOODS_SCRIPT = """
+for i = 1, #KEYS do
+    if redis.call('zscore', KEYS[i], ARGV[i * 2 - 1]) then
+        redis.call('zincrby', KEYS[i], ARGV[i * 2], ARGV[i * 2 - 1])
+    end
+end
+return 1
+"""
+
+
+def _zset_key(category_id):
+    return 'hot_skus_%s' % category_id
+
+
+def _built_key(category_id):
+    return 'hot_skus_built_%s' % category_id
+
+
+def _write_hot_goods(pl, category_id, skus):
+    """在管道中整体替换一个类别的排行"""
+    zset_key = _zset_key(category_id)
+    pl.delete(zset_key)
+    if skus:
+        pl.zadd(zset_key, {sku_id: sales for sku_id, sales in skus})
+    pl.set(_built_key(category_id), 1)
+
+
+def rebuild_hot_goods(category_ids):
+    """用一条查询重建多个类别的热销排行"""
+    category_skus = {category_id: [] for category_id in category_ids}
+    sku_qs = SKU.objects.filter(category_id__in=category_ids, is_launched=True).values_list(
+        'category_id', 'id', 'sales')
+    for category_id, sku_id, sales in sku_qs:
+        category_skus[category_id].append((sku_id, sales))
+
+    redis_conn = get_redis_connection('default')
+    pl = redis_conn.pipeline()
+    for category_id, skus in category_skus.items():
+        _write_hot_goods(pl, category_id, skus)
+    pl.execute()
+
+
+def get_hot_skus(category_id, count):
+    """读取类别销量最高的count个商品, 排行还没建立时返回None"""
+    redis_conn = get_redis_connection('default')
+    pl = redis_conn.pipeline(transaction=False)
+    pl.exists(_built_key(category_id))
+    pl.zrevrange(_zset_key(category_id), 0, count - 1)
+    is_built, sku_ids = pl.execute()
+    if not is_built:
+        return None
+
+    sku_ids = [int(sku_id) for sku_id in sku_ids]
+    summaries = get_sku_summaries(sku_ids)
+    return [summaries[sku_id] for sku_id in sku_ids if sku_id in summaries]
+
+
+def incr_hot_goods(sales):
+    """下单成功后累加排行中的销量
+    :param sales: [(category_id, sku_id, 购买数量), ...]
+    """
+    if not sales:
+        return
+    keys = []
+    args = []
+    for category_id, sku_id, count in sales:
+        keys.append(_zset_key(category_id))
+        args.extend([sku_id, count])
+    redis_conn = get_redis_connection('default')
+    redis_conn.eval(INCR_HOT_GOODS_SCRIPT, len(keys), *(keys + args))
+
+
+def invalidate_hot_goods(category_id):
+    """sku上下架等变化后删除类别的排行, 下次访问时重建"""
+    redis_conn = get_redis_connection('default')
+    redis_conn.delete(_zset_key(category_id), _built_key(category_id))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from goods.crons import generate_static_detail_html
+
+
+class Command(BaseCommand):
+    help = '生成商品静态详情页, 默认只重新生成上次之后有变化的sku'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='重新生成所有sku的详情页')
+        parser.add_argument('--processes', type=int, default=None, help='进程数, 默认为cpu核数')
+
+    def handle(self, *args, **options):
+        count, seconds = generate_static_detail_html(full=options['full'], processes=options['processes'])
+        rate = count / seconds if seconds else 0
+        self.stdout.write(self.style.SUCCESS(
+            '生成%d个详情页, 耗时%.2f秒, %.1f pages/s' % (count, seconds, rate)))
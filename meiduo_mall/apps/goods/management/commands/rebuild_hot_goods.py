@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from goods.hot_goods import rebuild_hot_goods
+from goods.models import SKU
+
+
+class Command(BaseCommand):
+    help = '从tb_sku分批重建所有类别的热销排行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='每批重建的类别数量')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        category_ids = list(SKU.objects.order_by('category_id').values_list('category_id', flat=True).distinct())
+
+        for start in range(0, len(category_ids), batch_size):
+            batch = category_ids[start:start + batch_size]
+            rebuild_hot_goods(batch)
+            self.stdout.write('rebuilt %d/%d categories' % (start + len(batch), len(category_ids)))
+
+        self.stdout.write(self.style.SUCCESS('热销排行重建完成'))
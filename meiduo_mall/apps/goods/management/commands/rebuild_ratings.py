@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from goods.ratings import rebuild_ratings, REBUILD_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = '分批读取tb_order_goods, 重建所有sku和spu的评分汇总'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE, help='每批读取的订单商品数量')
+
+    def handle(self, *args, **options):
+        total, sku_count, spu_count = rebuild_ratings(
+            options['chunk_size'], progress=lambda count: self.stdout.write('read %d comments' % count))
+        self.stdout.write(self.style.SUCCESS('评分汇总重建完成: %d条评价, %d个sku, %d个spu' % (total, sku_count, spu_count)))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_visits(apps, schema_editor):
+    """合并同一类别同一天的重复记录, 以便建立唯一索引"""
+    GoodsVisitCount = apps.get_model('goods', 'GoodsVisitCount')
+    duplicates = GoodsVisitCount.objects.values('category_id', 'date').annotate(
+        rows=Count('id'), first_id=Min('id'), total=Sum('count')).filter(rows__gt=1)
+    for item in duplicates:
+        GoodsVisitCount.objects.filter(id=item['first_id']).update(count=item['total'])
+        GoodsVisitCount.objects.filter(category_id=item['category_id'], date=item['date']).exclude(
+            id=item['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0002_goodsvisitcount'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_visits, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='goodsvisitcount',
+            unique_together=set([('category', 'date')]),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0003_goodsvisitcount_unique_category_date'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='sku',
+            index_together=set([
+                ('category', 'is_launched', 'price'),
+                ('category', 'is_launched', 'sales'),
+                ('category', 'is_launched', 'create_time'),
+            ]),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0004_sku_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SKURating',
+            fields=[
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('count', models.IntegerField(default=0, verbose_name='评价数')),
+                ('score_sum', models.IntegerField(default=0, verbose_name='评分总和')),
+                ('average', models.DecimalField(decimal_places=2, default=0, max_digits=3, verbose_name='平均评分')),
+                ('score_0', models.IntegerField(default=0, verbose_name='0分评价数')),
+                ('score_1', models.IntegerField(default=0, verbose_name='20分评价数')),
+                ('score_2', models.IntegerField(default=0, verbose_name='40分评价数')),
+                ('score_3', models.IntegerField(default=0, verbose_name='60分评价数')),
+                ('score_4', models.IntegerField(default=0, verbose_name='80分评价数')),
+                ('score_5', models.IntegerField(default=0, verbose_name='100分评价数')),
+                ('sku', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='goods.SKU', verbose_name='sku')),
+            ],
+            options={
+                'verbose_name': 'SKU评分汇总',
+                'verbose_name_plural': 'SKU评分汇总',
+                'db_table': 'tb_sku_rating',
+            },
+        ),
+        migrations.CreateModel(
+            name='SPURating',
+            fields=[
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('count', models.IntegerField(default=0, verbose_name='评价数')),
+                ('score_sum', models.IntegerField(default=0, verbose_name='评分总和')),
+                ('average', models.DecimalField(decimal_places=2, default=0, max_digits=3, verbose_name='平均评分')),
+                ('score_0', models.IntegerField(default=0, verbose_name='0分评价数')),
+                ('score_1', models.IntegerField(default=0, verbose_name='20分评价数')),
+                ('score_2', models.IntegerField(default=0, verbose_name='40分评价数')),
+                ('score_3', models.IntegerField(default=0, verbose_name='60分评价数')),
+                ('score_4', models.IntegerField(default=0, verbose_name='80分评价数')),
+                ('score_5', models.IntegerField(default=0, verbose_name='100分评价数')),
+                ('spu', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='goods.SPU', verbose_name='spu')),
+            ],
+            options={
+                'verbose_name': 'SPU评分汇总',
+                'verbose_name_plural': 'SPU评分汇总',
+                'db_table': 'tb_spu_rating',
+            },
+        ),
+    ]
@@ -100,6 +100,12 @@ class SKU(BaseModel):
 
     class Meta:
         db_table = 'tb_sku'
+        # 商品列表按(排序字段, id)分页时使用
+        index_together = [
+            ('category', 'is_launched', 'price'),
+            ('category', 'is_launched', 'sales'),
+            ('category', 'is_launched', 'create_time'),
+        ]
         verbose_name = '商品SKU'
         verbose_name_plural = verbose_name
 
@@ -172,7 +178,44 @@ class GoodsVisitCount(BaseModel):
 
     class Meta:
         db_table = 'tb_goods_visit'
+        unique_together = ('category', 'date')
         verbose_name = '统计分类商品访问量'
         verbose_name_plural = verbose_name
 
 
+class RatingModel(BaseModel):
+    """评分汇总, 评分取值同OrderGoods.SCORE_CHOICES(0-5)"""
+    count = models.IntegerField(default=0, verbose_name='评价数')
+    score_sum = models.IntegerField(default=0, verbose_name='评分总和')
+    average = models.DecimalField(max_digits=3, decimal_places=2, default=0, verbose_name='平均评分')
+    score_0 = models.IntegerField(default=0, verbose_name='0分评价数')
+    score_1 = models.IntegerField(default=0, verbose_name='20分评价数')
+    score_2 = models.IntegerField(default=0, verbose_name='40分评价数')
+    score_3 = models.IntegerField(default=0, verbose_name='60分评价数')
+    score_4 = models.IntegerField(default=0, verbose_name='80分评价数')
+    score_5 = models.IntegerField(default=0, verbose_name='100分评价数')
+
+    class Meta:
+        abstract = True
+
+
+class SKURating(RatingModel):
+    """SKU评分汇总"""
+    sku = models.OneToOneField(SKU, primary_key=True, related_name='rating', on_delete=models.CASCADE,
+                              verbose_name='sku')
+
+    class Meta:
+        db_table = 'tb_sku_rating'
+        verbose_name = 'SKU评分汇总'
+        verbose_name_plural = verbose_name
+
+
+class SPURating(RatingModel):
+    """SPU评分汇总"""
+    spu = models.OneToOneField(SPU, primary_key=True, related_name='rating', on_delete=models.CASCADE,
+                              verbose_name='spu')
+
+    class Meta:
+        db_table = 'tb_spu_rating'
+        verbose_name = 'SPU评分汇总'
+        verbose_name_plural = verbose_name
@@ -0,0 +1,89 @@
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.db.models import DecimalField, Q, Value
+from django.db.models.functions import Coalesce
+
+from meiduo_mall.utils.cache import get_cache_version, incr_cache_version
+from .models import SKU
+
+# 排序规则: (排序字段, 是否降序), 都以id作为第二排序字段保证顺序唯一
+SORT_FIELDS = {
+    'price': ('price', False),
+    'hot': ('sales', True),
+    'default': ('create_time', True),
+    'rating': ('rating_average', True),
+}
+# 不是sku字段的排序值, 还没有评价的sku没有评分汇总, 按0分排序
+SORT_ANNOTATIONS = {
+    'rating_average': Coalesce('rating__average', Value(0), output_field=DecimalField(max_digits=3, decimal_places=2)),
+}
+# 每页显示的商品数量
+GOODS_LIST_LIMIT = 5
+# 分页索引缓存有效期(秒), 销量和评分通过update()修改不会触发信号, 靠过期刷新
+PAGE_INDEX_CACHE_EXPIRES = 300
+
+
+def _version_key(category_id):
+    return 'sku_list_version_%s' % category_id
+
+
+def _get_ordering(sort):
+    field, desc = SORT_FIELDS[sort]
+    return ('-%s' % field, '-id') if desc else (field, 'id')
+
+
+def sku_list_queryset(category_id, sort):
+    """类别下上架的sku, 按(排序字段, id)排序"""
+    sku_qs = SKU.objects.filter(category_id=category_id, is_launched=True)
+    field, _ = SORT_FIELDS[sort]
+    if field in SORT_ANNOTATIONS:
+        sku_qs = sku_qs.annotate(**{field: SORT_ANNOTATIONS[field]})
+    return sku_qs.order_by(*_get_ordering(sort))
+
+
+def build_page_index(category_id, sort):
+    """只查询排序字段和id, 记录下每一页最后一条数据的(排序值, id)
+    第n页的数据就是排在第n-1页边界之后的GOODS_LIST_LIMIT条
+    """
+    field, desc = SORT_FIELDS[sort]
+    keys = list(sku_list_queryset(category_id, sort).values_list(field, 'id'))
+    boundaries = keys[GOODS_LIST_LIMIT - 1::GOODS_LIST_LIMIT]
+    total_page = max((len(keys) + GOODS_LIST_LIMIT - 1) // GOODS_LIST_LIMIT, 1)
+    return {'boundaries': boundaries, 'total_page': total_page}
+
+
+def get_page_index(category_id, sort):
+    """读取(类别, 排序)的分页索引, 缓存未命中时重新构造"""
+    version = get_cache_version(_version_key(category_id))
+    key = 'sku_page_index_%s_%s' % (category_id, sort)
+    page_index = cache.get(key, version=version)
+    if page_index is None:
+        page_index = build_page_index(category_id, sort)
+        cache.set(key, page_index, PAGE_INDEX_CACHE_EXPIRES, version=version)
+    return page_index
+
+
+def invalidate_page_index(category_id):
+    """类别下的sku变化后让该类别所有排序的分页索引失效"""
+    incr_cache_version(_version_key(category_id))
+
+
+def get_keyset_page(category_id, sort, page_num):
+    """按(排序字段, id)定位第page_num页的数据, 不做COUNT和OFFSET
+    :return: (当前页sku列表, 总页数)
+    """
+    page_index = get_page_index(category_id, sort)
+    total_page = page_index['total_page']
+    if page_num < 1 or page_num > total_page:
+        raise EmptyPage('当前页不存在')
+
+    field, desc = SORT_FIELDS[sort]
+    sku_qs = sku_list_queryset(category_id, sort)
+    if page_num > 1:
+        value, sku_id = page_index['boundaries'][page_num - 2]
+        lookup = 'lt' if desc else 'gt'
+        sku_qs = sku_qs.filter(
+            Q(**{'%s__%s' % (field, lookup): value}) | Q(**{field: value, 'id__%s' % lookup: sku_id})
+        )
+    page_skus = list(sku_qs[:GOODS_LIST_LIMIT])
+    return page_skus, total_page
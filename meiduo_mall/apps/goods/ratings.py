@@ -0,0 +1,103 @@
+"""商品评分汇总
+
+每次评价时用F()累加sku和spu的评价数、评分总和和各分数的评价数, 再重新计算平均分,
+商品列表按评分排序时直接关联tb_sku_rating, 不需要在请求时GROUP BY tb_order_goods
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F
+
+from orders.models import OrderGoods
+from .models import SKU, SKURating, SPURating
+
+SCORES = [score for score, _ in OrderGoods.SCORE_CHOICES]
+# 重建时每次从tb_order_goods读取的行数
+REBUILD_CHUNK_SIZE = 5000
+
+
+def _average_expression():
+    return ExpressionWrapper(F('score_sum') * Decimal('1.00') / F('count'),
+                             output_field=DecimalField(max_digits=3, decimal_places=2))
+
+
+def _new_totals():
+    totals = {'count': 0, 'score_sum': 0}
+    totals.update({'score_%s' % score: 0 for score in SCORES})
+    return totals
+
+
+def _add_score(totals_dict, pk, score):
+    """把一个评分累加到 {sku_id或spu_id: {'count', 'score_sum', 'score_0'..}} 中"""
+    totals = totals_dict.setdefault(pk, _new_totals())
+    totals['count'] += 1
+    totals['score_sum'] += score
+    totals['score_%s' % score] += 1
+
+
+def _add_totals(model, totals_dict):
+    for pk, totals in totals_dict.items():
+        increments = {field: F(field) + value for field, value in totals.items() if value}
+        if model.objects.filter(pk=pk).update(**increments):
+            continue
+        try:
+            # 第一次评价时创建, 并发创建失败时改为累加
+            with transaction.atomic():
+                model.objects.create(pk=pk, **totals)
+        except IntegrityError:
+            model.objects.filter(pk=pk).update(**increments)
+
+    # 累加之后再计算平均分, 避免依赖同一条UPDATE中各字段的赋值顺序
+    model.objects.filter(pk__in=totals_dict).update(average=_average_expression())
+
+
+def add_ratings(ratings):
+    """累加新的评价, 在调用方的事务中执行
+    :param ratings: [(sku_id, spu_id, score)]
+    """
+    if not ratings:
+        return
+    sku_totals, spu_totals = {}, {}
+    for sku_id, spu_id, score in ratings:
+        _add_score(sku_totals, sku_id, score)
+        _add_score(spu_totals, spu_id, score)
+    _add_totals(SKURating, sku_totals)
+    _add_totals(SPURating, spu_totals)
+
+
+def rebuild_ratings(chunk_size=REBUILD_CHUNK_SIZE, progress=None):
+    """按id分批读取所有已评价的订单商品, 重新计算所有sku和spu的评分汇总
+    重建期间提交的评价可能被覆盖, 应在访问量低时执行
+    :param progress: 每读完一批调用一次, 参数为已读取的行数
+    :return: (评价数, sku数, spu数)
+    """
+    sku_totals, spu_totals = {}, {}
+    spu_ids = {}
+    last_id, total = 0, 0
+    while True:
+        rows = list(OrderGoods.objects.filter(id__gt=last_id, is_commented=True).order_by('id').values_list(
+            'id', 'sku_id', 'score')[:chunk_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        total += len(rows)
+
+        missing = {sku_id for _, sku_id, _ in rows if sku_id not in spu_ids}
+        if missing:
+            spu_ids.update(SKU.objects.filter(id__in=missing).values_list('id', 'spu_id'))
+        for _, sku_id, score in rows:
+            if sku_id in spu_ids:
+                _add_score(sku_totals, sku_id, score)
+                _add_score(spu_totals, spu_ids[sku_id], score)
+        if progress:
+            progress(total)
+
+    with transaction.atomic():
+        for model, totals_dict in ((SKURating, sku_totals), (SPURating, spu_totals)):
+            model.objects.all().delete()
+            objs = []
+            for pk, totals in totals_dict.items():
+                average = (Decimal(totals['score_sum']) / totals['count']).quantize(Decimal('0.01'))
+                objs.append(model(pk=pk, average=average, **totals))
+            model.objects.bulk_create(objs, batch_size=1000)
+    return total, len(sku_totals), len(spu_totals)
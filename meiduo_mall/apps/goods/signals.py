@@ -0,0 +1,39 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import SKU, SPUSpecification, SpecificationOption, SKUSpecification
+from .hot_goods import invalidate_hot_goods
+from .pagination import invalidate_page_index
+from .sku_cache import invalidate_sku_summary
+from .spec_matrix import invalidate_spec_matrix
+
+
+@receiver([post_save, post_delete], sender=SKUSpecification)
+def sku_specification_changed(sender, instance, **kwargs):
+    """sku规格变化, 失效所属spu的规格矩阵"""
+    spu_id = SKU.objects.filter(id=instance.sku_id).values_list('spu_id', flat=True).first()
+    if spu_id is not None:
+        invalidate_spec_matrix(spu_id)
+
+
+@receiver([post_save, post_delete], sender=SpecificationOption)
+def specification_option_changed(sender, instance, **kwargs):
+    """规格选项变化"""
+    spu_id = SPUSpecification.objects.filter(id=instance.spec_id).values_list('spu_id', flat=True).first()
+    if spu_id is not None:
+        invalidate_spec_matrix(spu_id)
+
+
+@receiver([post_save, post_delete], sender=SPUSpecification)
+def spu_specification_changed(sender, instance, **kwargs):
+    """spu规格变化"""
+    invalidate_spec_matrix(instance.spu_id)
+
+
+@receiver([post_save, post_delete], sender=SKU)
+def sku_changed(sender, instance, **kwargs):
+    """spu下增删sku, 类别下的商品列表变化"""
+    invalidate_spec_matrix(instance.spu_id)
+    invalidate_page_index(instance.category_id)
+    invalidate_hot_goods(instance.category_id)
+    invalidate_sku_summary(instance.id)
@@ -0,0 +1,117 @@
+"""sku摘要缓存: 只包含列表展示需要的id、名称、价格、默认图片
+
+读取顺序: 进程内LRU -> redis MGET -> 数据库
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django_redis import get_redis_connection
+
+from .models import SKU
+
+# sku摘要缓存有效期(秒), sku保存时主动删除
+SKU_SUMMARY_CACHE_EXPIRES = 3600
+# 进程内LRU的容量和有效期(秒), 其它进程修改sku后只能靠过期刷新, 所以有效期要短
+SKU_SUMMARY_LRU_SIZE = 2000
+SKU_SUMMARY_LRU_EXPIRES = 10
+
+
+class _LRUCache(object):
+    """线程安全的定长LRU, 每个条目带过期时间"""
+
+    def __init__(self, maxsize, expires):
+        self.maxsize = maxsize
+        self.expires = expires
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        result = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                expire_time, value = item
+                if expire_time < now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                result[key] = value
+        return result
+
+    def set_many(self, mapping):
+        expire_time = time.time() + self.expires
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (expire_time, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+_local_cache = _LRUCache(SKU_SUMMARY_LRU_SIZE, SKU_SUMMARY_LRU_EXPIRES)
+
+
+def _summary_key(sku_id):
+    return 'sku_summary_%s' % sku_id
+
+
+def _dump_summary(sku):
+    return {
+        'id': sku.id,
+        'name': sku.name,
+        'price': str(sku.price),
+        'default_image_url': sku.default_image.url,
+    }
+
+
+def get_sku_summaries(sku_ids):
+    """批量读取sku摘要, 先读进程内LRU再读redis, 都没有的一次查库补齐并写回
+    返回的摘要字典在进程内共享, 调用方不要修改
+    :return: {sku_id: {'id': 1, 'name': 'xx', 'price': '10.00', 'default_image_url': 'http://...'}}
+    不存在的sku不在结果中
+    """
+    sku_ids = [int(sku_id) for sku_id in sku_ids]
+    summaries = _local_cache.get_many(sku_ids)
+    redis_ids = [sku_id for sku_id in sku_ids if sku_id not in summaries]
+    if not redis_ids:
+        return summaries
+
+    redis_conn = get_redis_connection('default')
+    values = redis_conn.mget([_summary_key(sku_id) for sku_id in redis_ids])
+
+    loaded = {}
+    missing_ids = []
+    for sku_id, value in zip(redis_ids, values):
+        if value is None:
+            missing_ids.append(sku_id)
+        else:
+            loaded[sku_id] = json.loads(value.decode())
+
+    if missing_ids:
+        sku_qs = SKU.objects.filter(id__in=missing_ids).only('id', 'name', 'price', 'default_image')
+        pl = redis_conn.pipeline(transaction=False)
+        for sku in sku_qs:
+            summary = _dump_summary(sku)
+            loaded[sku.id] = summary
+            pl.setex(_summary_key(sku.id), SKU_SUMMARY_CACHE_EXPIRES, json.dumps(summary))
+        pl.execute()
+
+    _local_cache.set_many(loaded)
+    summaries.update(loaded)
+    return summaries
+
+
+def invalidate_sku_summary(sku_id):
+    """sku修改后删除它的摘要缓存"""
+    _local_cache.delete(int(sku_id))
+    redis_conn = get_redis_connection('default')
+    redis_conn.delete(_summary_key(sku_id))
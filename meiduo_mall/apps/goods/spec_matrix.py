@@ -0,0 +1,85 @@
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from meiduo_mall.utils.cache import get_cache_version, incr_cache_version
+from .models import SPUSpecification, SpecificationOption, SKUSpecification
+
+# 规格矩阵缓存有效期(秒), 数据变化时靠版本号失效
+SPEC_MATRIX_CACHE_EXPIRES = 3600 * 24
+
+
+def _version_key(spu_id):
+    return 'spec_matrix_version_%s' % spu_id
+
+
+def build_spec_matrix(spu_id):
+    """用固定条数的查询构造spu的规格矩阵
+    {
+        'specs': [(规格id, 规格名, [(选项id, 选项值), ...]), ...],
+        'sku_options': {3: (8, 11), 4: (8, 12)},
+        'option_sku_map': {(8, 11): 3, (8, 12): 4},
+    }
+    """
+    # 规格及其选项: 2条查询
+    spec_qs = SPUSpecification.objects.filter(spu_id=spu_id).order_by('id').prefetch_related(
+        Prefetch('options', queryset=SpecificationOption.objects.order_by('id'))
+    )
+    specs = []
+    for spec in spec_qs:
+        options = [(option.id, option.value) for option in spec.options.all()]
+        specs.append((spec.id, spec.name, options))
+
+    # spu下所有sku的规格选项: 1条查询
+    sku_spec_qs = SKUSpecification.objects.filter(sku__spu_id=spu_id).order_by(
+        'sku_id', 'spec_id').values_list('sku_id', 'option_id')
+    sku_options = {}
+    for sku_id, option_id in sku_spec_qs:
+        sku_options.setdefault(sku_id, []).append(option_id)
+
+    sku_options = {sku_id: tuple(option_ids) for sku_id, option_ids in sku_options.items()}
+    option_sku_map = {option_ids: sku_id for sku_id, option_ids in sku_options.items()}
+
+    return {
+        'specs': specs,
+        'sku_options': sku_options,
+        'option_sku_map': option_sku_map,
+    }
+
+
+def get_spec_matrix(spu_id):
+    """读取spu的规格矩阵, 缓存未命中时重新构造"""
+    version = get_cache_version(_version_key(spu_id))
+    key = 'spec_matrix_%s' % spu_id
+    matrix = cache.get(key, version=version)
+    if matrix is None:
+        matrix = build_spec_matrix(spu_id)
+        cache.set(key, matrix, SPEC_MATRIX_CACHE_EXPIRES, version=version)
+    return matrix
+
+
+def invalidate_spec_matrix(spu_id):
+    """spu的规格数据变化后让旧的规格矩阵失效"""
+    incr_cache_version(_version_key(spu_id))
+
+
+def get_sku_spec_options(matrix, sku_id):
+    """给当前sku的每个规格选项绑定上切换后对应的sku_id
+    [{'name': '颜色', 'spec_options': [{'value': '金色', 'sku_id': 3}, ...]}, ...]
+    """
+    current_option_ids = list(matrix['sku_options'].get(sku_id, ()))
+    option_sku_map = matrix['option_sku_map']
+
+    spec_list = []
+    for index, (spec_id, spec_name, options) in enumerate(matrix['specs']):
+        temp_option_ids = current_option_ids[:]  # 复制一个新的当前显示商品的规格选项列表
+        spec_options = []
+        for option_id, value in options:
+            sku_id_for_option = None
+            if index < len(temp_option_ids):
+                temp_option_ids[index] = option_id
+                sku_id_for_option = option_sku_map.get(tuple(temp_option_ids))
+            spec_options.append({'id': option_id, 'value': value, 'sku_id': sku_id_for_option})
+
+        spec_list.append({'id': spec_id, 'name': spec_name, 'spec_options': spec_options})
+
+    return spec_list
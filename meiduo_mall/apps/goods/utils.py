@@ -1,3 +1,14 @@
+import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from contents.utils import get_categories
+from .models import GoodsCategory
+from .spec_matrix import get_spec_matrix, get_sku_spec_options
+
+
 def get_breadcrumb(category):
 
     cat1 = category.parent.parent
@@ -9,3 +20,67 @@ def get_breadcrumb(category):
     }
     return breadcrumb
 
+
+def get_detail_context(sku):
+    """构造商品详情页的模板数据, 详情页视图和静态化共用
+    sku需要select_related('category__parent__parent', 'spu')
+    """
+    category = sku.category
+    spu = sku.spu
+    # 从规格矩阵中取出当前sku每个规格选项切换后对应的sku_id, 查询次数与sku数量无关
+    spec_matrix = get_spec_matrix(spu.id)
+
+    return {
+        'categories': get_categories(),  # 商品分类
+        'breadcrumb': get_breadcrumb(category),  # 面包屑导航
+        'sku': sku,  # 当前要显示的sku模型对象
+        'category': category,  # 当前的显示sku所属的三级类别
+        'spu': spu,  # sku所属的spu
+        'spec_qs': get_sku_spec_options(spec_matrix, sku.id),  # 当前商品的所有规格数据
+    }
+
+
+def incr_category_visit(category_id):
+    """类别访问量先累加到redis中当天的hash里, 由定时任务批量写入数据库"""
+    redis_conn = get_redis_connection('default')
+    redis_conn.hincrby('visit_%s' % timezone.now().strftime('%Y%m%d'), category_id, 1)
+
+
+def flush_category_visits():
+    """把redis中累计的类别访问量批量合并到tb_goods_visit
+    visit_20190601 -> rename -> visit_flush_20190601 -> 写库成功后删除
+    写库失败时visit_flush_xxx会保留, 下次执行时重新写入
+    """
+    redis_conn = get_redis_connection('default')
+    for key in redis_conn.scan_iter('visit_*'):
+        key = key.decode()
+        if key.startswith('visit_flush_'):
+            flush_key = key
+        else:
+            flush_key = key.replace('visit_', 'visit_flush_', 1)
+            # 上次未写入的数据还在时先不动, 等它写入后下一轮再处理
+            if not redis_conn.renamenx(key, flush_key):
+                continue
+
+        counts = redis_conn.hgetall(flush_key)
+        if counts:
+            date = datetime.datetime.strptime(flush_key[len('visit_flush_'):], '%Y%m%d').date()
+            _upsert_category_visits(date, {int(category_id): int(count) for category_id, count in counts.items()})
+        redis_conn.delete(flush_key)
+
+
+def _upsert_category_visits(date, counts):
+    """按(category_id, date)批量插入或累加访问量"""
+    # 丢弃已不存在的类别
+    category_ids = GoodsCategory.objects.filter(id__in=counts.keys()).values_list('id', flat=True)
+    now = timezone.now()
+    rows = [(category_id, date, counts[category_id], now, now) for category_id in category_ids]
+    if not rows:
+        return
+
+    sql = ('INSERT INTO tb_goods_visit (category_id, date, count, create_time, update_time) '
+           'VALUES (%s, %s, %s, %s, %s) '
+           'ON DUPLICATE KEY UPDATE count = count + VALUES(count), update_time = VALUES(update_time)')
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
@@ -1,14 +1,18 @@
 from django.shortcuts import render
-from django.utils import timezone
 from django.views import View
 from django import http
 from django.core.paginator import Paginator, EmptyPage
+from django.conf import settings
 
 from contents.utils import get_categories
-from .utils import get_breadcrumb
+from .utils import get_breadcrumb, get_detail_context, incr_category_visit
+from .hot_goods import get_hot_skus, rebuild_hot_goods
+from .pagination import get_keyset_page, sku_list_queryset, GOODS_LIST_LIMIT, SORT_FIELDS
 from .models import GoodsCategory, SKU
 from meiduo_mall.utils.response_code import RETCODE
-from .models import GoodsCategory, SKU, GoodsVisitCount
+
+# 热销排行显示的商品数量
+HOT_GOODS_COUNT = 2
 
 
 class ListView(View):
@@ -23,23 +27,25 @@ class ListView(View):
 
         # 获取前端传入的排序规则
         sort = request.GET.get('sort')
-        if sort == 'price':
-            sort_field = 'price'
-        elif sort == 'hot':
-            sort_field = '-sales'
-        else:
+        if sort not in SORT_FIELDS:
             sort = 'default'
-            sort_field = '-create_time'
 
-        # sku_qs = category.sku_set.filter(is_launched=True)
-        sku_qs = SKU.objects.filter(category=category, is_launched=True).order_by(sort_field)
+        if settings.GOODS_LIST_KEYSET_PAGINATION:
+            # 按(排序字段, id)定位分页, 总页数来自缓存的分页索引
+            try:
+                page_skus, total_page = get_keyset_page(category.id, sort, int(page_num))
+            except EmptyPage:
+                return http.HttpResponseForbidden('当前页不存在')
+        else:
+            # sku_qs = category.sku_set.filter(is_launched=True)
+            sku_qs = sku_list_queryset(category.id, sort)
 
-        paginator = Paginator(sku_qs, 5)
-        try:
-            page_skus = paginator.page(page_num)
-        except EmptyPage:
-            return http.HttpResponseForbidden('当前页不存在')
-        total_page = paginator.num_pages
+            paginator = Paginator(sku_qs, GOODS_LIST_LIMIT)
+            try:
+                page_skus = paginator.page(page_num)
+            except EmptyPage:
+                return http.HttpResponseForbidden('当前页不存在')
+            total_page = paginator.num_pages
 
         context = {
             'categories': get_categories(),  # 频道分类
@@ -59,21 +65,14 @@ class HotGoodsView(View):
 
     def get(self, request, category_id):
 
-        try:
-            category = GoodsCategory.objects.get(id=category_id)
-        except GoodsCategory.DoesNotExist:
-            return http.HttpResponseForbidden('商品类别不存在')
-
-        sku_qs = SKU.objects.filter(category=category, is_launched=True).order_by('-sales')[:2]
-        hot_skus = []
-
-        for sku in sku_qs:
-            hot_skus.append({
-                'id': sku.id,
-                'name': sku.name,
-                'price': sku.price,
-                'default_image_url': sku.default_image.url
-            })
+        # 热销排行保存在redis的zset中, 命中时不查询数据库
+        hot_skus = get_hot_skus(category_id, HOT_GOODS_COUNT)
+        if hot_skus is None:
+            if not GoodsCategory.objects.filter(id=category_id).exists():
+                return http.HttpResponseForbidden('商品类别不存在')
+            rebuild_hot_goods([int(category_id)])
+            hot_skus = get_hot_skus(category_id, HOT_GOODS_COUNT) or []
+
         return http.JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK', 'hot_skus': hot_skus})
 
 
@@ -83,54 +82,11 @@ class DetailView(View):
     def get(self, request, sku_id):
 
         try:
-            sku = SKU.objects.get(id=sku_id)
+            sku = SKU.objects.select_related('category__parent__parent', 'spu').get(id=sku_id)
         except SKU.DoesNotExist:
             return render(request, '404.html')
 
-        category = sku.category
-        spu = sku.spu
-        """1.准备当前商品的规格选项列表 [8, 11]"""
-        # 获取出当前正显示的sku商品的规格选项id列表
-        current_sku_spec_qs = sku.specs.order_by('spec_id')
-        current_sku_option_ids = []  # [8, 11]
-        for current_sku_spec in current_sku_spec_qs:
-            current_sku_option_ids.append(current_sku_spec.option_id)
-
-        """2.构造规格选择仓库
-        {(8, 11): 3, (8, 12): 4, (9, 11): 5, (9, 12): 6, (10, 11): 7, (10, 12): 8}
-        """
-        # 构造规格选择仓库
-        temp_sku_qs = spu.sku_set.all()  # 获取当前spu下的所有sku
-        # 选项仓库大字典
-        spec_sku_map = {}  # {(8, 11): 3, (8, 12): 4, (9, 11): 5, (9, 12): 6, (10, 11): 7, (10, 12): 8}
-        for temp_sku in temp_sku_qs:
-            # 查询每一个sku的规格数据
-            temp_spec_qs = temp_sku.specs.order_by('spec_id')
-            temp_sku_option_ids = []  # 用来包装每个sku的选项值
-            for temp_spec in temp_spec_qs:
-                temp_sku_option_ids.append(temp_spec.option_id)
-            spec_sku_map[tuple(temp_sku_option_ids)] = temp_sku.id
-
-        """3.组合 并找到sku_id 绑定"""
-        spu_spec_qs = spu.specs.order_by('id')  # 获取当前spu中的所有规格
-
-        for index, spec in enumerate(spu_spec_qs):  # 遍历当前所有的规格
-            spec_option_qs = spec.options.all()  # 获取当前规格中的所有选项
-            temp_option_ids = current_sku_option_ids[:]  # 复制一个新的当前显示商品的规格选项列表
-            for option in spec_option_qs:  # 遍历当前规格下的所有选项
-                temp_option_ids[index] = option.id  # [8, 12]
-                option.sku_id = spec_sku_map.get(tuple(temp_option_ids))  # 给每个选项对象绑定下他sku_id属性
-
-            spec.spec_options = spec_option_qs  # 把规格下的所有选项绑定到规格对象的spec_options属性上
-
-        context = {
-            'categories': get_categories(),  # 商品分类
-            'breadcrumb': get_breadcrumb(category),  # 面包屑导航
-            'sku': sku,  # 当前要显示的sku模型对象
-            'category': category,  # 当前的显示sku所属的三级类别
-            'spu': spu,  # sku所属的spu
-            'spec_qs': spu_spec_qs,  # 当前商品的所有规格数据
-        }
+        context = get_detail_context(sku)
 
         return render(request, 'detail.html', context)
 
@@ -139,22 +95,7 @@ class DetailVisitView(View):
     """统计商品类别每日访问量"""
     def post(self, request, category_id):
 
-        try:
-            category = GoodsCategory.objects.get(id=category_id)
-        except GoodsCategory.DoesNotExist:
-            return http.HttpResponseForbidden('category_id不存在')
-        today = timezone.now()
-
-        try:
-            goods_visit = GoodsVisitCount.objects.get(category=category, date=today)
-        except GoodsVisitCount.DoesNotExist:
-
-            goods_visit = GoodsVisitCount(category=category)
-
-        goods_visit.count += 1
-        goods_visit.save()
+        # 只在redis中累加, 由定时任务批量写入tb_goods_visit
+        incr_category_visit(category_id)
 
         return http.JsonResponse({'code':RETCODE.OK, 'errmsg': 'OK'})
-
-
-
@@ -0,0 +1,98 @@
+"""订单评价
+
+一个订单的多个商品可以在一次请求中评价, sku和spu的评价数和评分汇总用F()累加,
+并发提交时对订单行加锁, 评价数和订单状态都不会覆盖其他请求的修改
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from goods.models import SKU, SPU
+from goods.ratings import add_ratings
+from .models import OrderInfo, OrderGoods
+from .stock import case_by_id
+
+
+class CommentError(Exception):
+    """评价参数有误"""
+    pass
+
+
+def clean_comments(comments):
+    """校验评价参数
+    :param comments: [{'sku_id', 'comment', 'score', 'is_anonymous'}]
+    :return: {sku_id: {'comment', 'score', 'is_anonymous'}}
+    :raise CommentError: 参数有误
+    """
+    if not isinstance(comments, list) or not comments:
+        raise CommentError('缺少评价内容')
+
+    cleaned = {}
+    for item in comments:
+        if not isinstance(item, dict):
+            raise CommentError('评价参数有误')
+        try:
+            sku_id = int(item.get('sku_id'))
+            score = int(item.get('score'))
+        except (TypeError, ValueError):
+            raise CommentError('sku_id或score有误')
+        comment = item.get('comment')
+        is_anonymous = item.get('is_anonymous', False)
+        if not comment or not isinstance(comment, str):
+            raise CommentError('缺少评价内容')
+        if score not in dict(OrderGoods.SCORE_CHOICES):
+            raise CommentError('score有误')
+        if isinstance(is_anonymous, bool) is False:
+            raise CommentError('is_anonymous参数有误')
+        cleaned[sku_id] = {'comment': comment, 'score': score, 'is_anonymous': is_anonymous}
+    return cleaned
+
+
+def order_goods_sku_id(order_id, user, order_goods_id):
+    """旧的评价接口用订单商品的id作为sku_id, 转换为真正的sku_id
+    :return: sku_id, 不是该用户这个订单中的商品时返回None
+    """
+    try:
+        order_goods_id = int(order_goods_id)
+    except (TypeError, ValueError):
+        return None
+    return OrderGoods.objects.filter(id=order_goods_id, order_id=order_id, order__user=user).values_list(
+        'sku_id', flat=True).first()
+
+
+def save_comments(order_id, user, comments):
+    """保存一个订单中多个商品的评价, 全部评价后订单改为已完成
+    :param comments: clean_comments的返回值
+    :return: 本次评价的商品 [(sku_id, spu_id, score)], 已经评价过的商品会被跳过
+    :raise OrderInfo.DoesNotExist: 订单不存在或不是待评价
+    """
+    with transaction.atomic():
+        # 锁住订单, 同一订单的评价依次处理
+        order = OrderInfo.objects.select_for_update().get(
+            order_id=order_id, user=user, status=OrderInfo.ORDER_STATUS_ENUM['UNCOMMENT'])
+
+        goods = order.skus.filter(sku_id__in=comments, is_commented=False).values_list('id', 'sku_id', 'sku__spu_id')
+        commented = []
+        for good_id, sku_id, spu_id in goods:
+            OrderGoods.objects.filter(id=good_id).update(is_commented=True, **comments[sku_id])
+            commented.append((sku_id, spu_id, comments[sku_id]['score']))
+
+        if commented:
+            sku_counts, spu_counts = {}, {}
+            for sku_id, spu_id, _ in commented:
+                sku_counts[sku_id] = sku_counts.get(sku_id, 0) + 1
+                spu_counts[spu_id] = spu_counts.get(spu_id, 0) + 1
+            # update()不会自动修改update_time, 手动修改后静态详情页才能增量更新评价数
+            now = timezone.now()
+            SKU.objects.filter(id__in=sku_counts).update(
+                comments=F('comments') + case_by_id(sku_counts), update_time=now)
+            SPU.objects.filter(id__in=spu_counts).update(
+                comments=F('comments') + case_by_id(spu_counts), update_time=now)
+            # 累加sku和spu的评分汇总
+            add_ratings(commented)
+
+        # 所有商品都评价了, 订单改为已完成
+        if not order.skus.filter(is_commented=False).exists():
+            order.status = OrderInfo.ORDER_STATUS_ENUM['FINISHED']
+            order.save(update_fields=['status', 'update_time'])
+    return commented
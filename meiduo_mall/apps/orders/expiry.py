@@ -0,0 +1,78 @@
+"""取消超时未支付的订单
+
+按(status, create_time)索引找出超过 settings.ORDER_UNPAID_EXPIRES 仍未支付的订单, 每批在一个短事务中
+改为已取消, 并把这一批订单商品按sku汇总后用F()还回库存、减去销量, 不会长时间持有锁
+
+redis预扣库存模式下先释放redis中到期的预扣记录, 再按上面的方式取消没有预扣记录的订单
+(开启该模式之前下的订单, 库存已经扣减到数据库); 还有预扣记录的订单只由预扣记录释放, 不会重复还回库存
+取消的订单都会从热销排行中减去销量
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .inventory import release_expired_reservations, reserved_order_ids
+from .models import OrderInfo, OrderGoods
+from .stock import apply_stock_changes, restore_hot_goods, run_with_retry
+
+# 每批取消的订单数量
+EXPIRE_BATCH_SIZE = 200
+
+
+def _cancel_batch(order_ids):
+    """取消一批订单并还回库存
+    :return: 取消的订单id列表
+    """
+    with transaction.atomic():
+        # 锁住仍未支付的订单, 同时到达的支付入账会等待, 之后按已取消的订单处理
+        order_ids = list(OrderInfo.objects.select_for_update().filter(
+            order_id__in=order_ids, status=OrderInfo.ORDER_STATUS_ENUM['UNPAID']).values_list('order_id', flat=True))
+        if not order_ids:
+            return []
+        OrderInfo.objects.filter(order_id__in=order_ids).update(status=OrderInfo.ORDER_STATUS_ENUM['CANCELED'])
+
+        counts = OrderGoods.objects.filter(order_id__in=order_ids).values('sku_id').annotate(total=Sum('count'))
+        # 扣减量为负数: 还回库存、减去销量
+        changes = {item['sku_id']: -item['total'] for item in counts}
+        if changes:
+            apply_stock_changes(changes)
+    return order_ids
+
+
+def cancel_expired_orders(batch_size=EXPIRE_BATCH_SIZE):
+    """取消所有超时未支付的订单
+    :return: 取消的订单数量
+    """
+    count = 0
+    if settings.INVENTORY_REDIS_MODE:
+        while True:
+            released = release_expired_reservations(batch_size)
+            count += released
+            # 这一批中有已支付的订单时可能提前结束, 剩下的由下次定时任务处理
+            if not released:
+                break
+
+    deadline = timezone.now() - datetime.timedelta(seconds=settings.ORDER_UNPAID_EXPIRES)
+    # 还有预扣记录的订单
+    skipped = set()
+    while True:
+        # 处理过的订单都不再是待支付状态, 每次从头扫描即可
+        order_ids = list(OrderInfo.objects.filter(
+            status=OrderInfo.ORDER_STATUS_ENUM['UNPAID'], create_time__lt=deadline).exclude(
+            order_id__in=skipped).order_by('create_time').values_list('order_id', flat=True)[:batch_size])
+        if not order_ids:
+            return count
+        scanned = len(order_ids)
+        if settings.INVENTORY_REDIS_MODE:
+            reserved = reserved_order_ids(order_ids)
+            skipped.update(reserved)
+            order_ids = [order_id for order_id in order_ids if order_id not in reserved]
+        if order_ids:
+            cancelled_ids = run_with_retry(_cancel_batch, order_ids)
+            restore_hot_goods(cancelled_ids)
+            count += len(cancelled_ids)
+        if scanned < batch_size:
+            return count
@@ -0,0 +1,99 @@
+"""我的订单
+
+订单列表按(create_time, order_id)倒序用游标分页, 每页只查询一次订单表, 不做COUNT和OFFSET
+订单商品从下单时保存的商品摘要中读取, 没有摘要的旧订单批量预取订单商品和sku
+"""
+import datetime
+import json
+
+from django.db.models import Prefetch, Q, prefetch_related_objects
+
+from .models import OrderInfo, OrderGoods
+
+# 每页显示的订单数量
+ORDERS_PER_PAGE = 5
+# 订单商品摘要中保存的商品数量
+ORDER_SUMMARY_SKUS = 3
+CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def build_goods_summary(lines):
+    """下单时生成订单商品摘要
+    :param lines: [(sku, 数量, 单价)]
+    :return: json字符串 {'count': 商品种数, 'skus': [前ORDER_SUMMARY_SKUS个商品]}
+    """
+    skus = []
+    for sku, count, price in lines[:ORDER_SUMMARY_SKUS]:
+        skus.append({
+            'id': sku.id,
+            'name': sku.name,
+            'default_image_url': sku.default_image.url,
+            'price': str(price),
+            'count': count,
+            'amount': str(price * count),
+        })
+    return json.dumps({'count': len(lines), 'skus': skus})
+
+
+def encode_cursor(order, backward=False):
+    """游标: 方向(n往后翻, p往前翻) + 订单的下单时间 + '_' + 订单号"""
+    return '%s%s_%s' % ('p' if backward else 'n', order.create_time.strftime(CURSOR_TIME_FORMAT), order.order_id)
+
+
+def decode_cursor(cursor):
+    """:raise ValueError: 游标格式不对"""
+    create_time, order_id = cursor[1:].split('_', 1)
+    if cursor[0] not in 'np' or not order_id.isdigit():
+        raise ValueError('游标格式不对')
+    return cursor[0] == 'p', datetime.datetime.strptime(create_time, CURSOR_TIME_FORMAT), order_id
+
+
+def _attach_sku_list(orders):
+    legacy_orders = []
+    for order in orders:
+        if order.goods_summary:
+            summary = json.loads(order.goods_summary)
+            order.sku_list = summary['skus']
+            order.sku_count = summary['count']
+        else:
+            legacy_orders.append(order)
+
+    # 没有摘要的旧订单, 两条查询取出所有订单商品和sku
+    prefetch_related_objects(legacy_orders, Prefetch('skus', queryset=OrderGoods.objects.select_related('sku')))
+    for order in legacy_orders:
+        goods = list(order.skus.all())
+        order.sku_list = json.loads(build_goods_summary([(good.sku, good.count, good.price) for good in goods]))['skus']
+        order.sku_count = len(goods)
+
+
+def get_order_page(user, cursor=None):
+    """查询一页订单
+    :param cursor: 为None时查询第一页
+    :return: (订单列表, 上一页的游标, 下一页的游标), 没有上一页或下一页时游标为None
+    :raise ValueError: 游标格式不对
+    """
+    order_qs = OrderInfo.objects.filter(user=user)
+    backward = False
+    if cursor:
+        backward, create_time, order_id = decode_cursor(cursor)
+        if backward:
+            order_qs = order_qs.filter(Q(create_time__gt=create_time) | Q(create_time=create_time, order_id__gt=order_id))
+        else:
+            order_qs = order_qs.filter(Q(create_time__lt=create_time) | Q(create_time=create_time, order_id__lt=order_id))
+
+    ordering = ('create_time', 'order_id') if backward else ('-create_time', '-order_id')
+    # 多查一条判断是否还有下一页
+    orders = list(order_qs.order_by(*ordering)[:ORDERS_PER_PAGE + 1])
+    has_more = len(orders) > ORDERS_PER_PAGE
+    orders = orders[:ORDERS_PER_PAGE]
+    if backward:
+        orders.reverse()
+    if not orders:
+        return orders, None, None
+
+    has_prev = has_more if backward else bool(cursor)
+    has_next = True if backward else has_more
+    _attach_sku_list(orders)
+    prev_cursor = encode_cursor(orders[0], backward=True) if has_prev else None
+    next_cursor = encode_cursor(orders[-1]) if has_next else None
+    return orders, prev_cursor, next_cursor
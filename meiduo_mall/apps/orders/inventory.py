@@ -0,0 +1,235 @@
+"""redis预扣库存
+
+开启 settings.INVENTORY_REDIS_MODE 后, 下单时先用lua脚本在redis中原子地检查并扣减所有sku的库存,
+库存不足的请求不会访问数据库. 扣减量累加在 stock_pending 中, 由celery任务批量同步到tb_sku
+
+stock_<sku_id>: redis中的可用库存, 等于 数据库库存 - 还未同步到数据库的扣减量
+stock_pending: {sku_id: 还未同步到数据库的扣减量}
+stock_flushing: 正在同步到数据库的 stock_pending
+stock_reservation_<order_id>: {sku_id: 数量} 订单预扣的库存
+stock_reservation_deadlines: zset(order_id: 到期时间) 订单到期仍未支付时取消订单并释放库存
+"""
+import logging
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from goods.models import SKU
+from .models import OrderInfo
+from .stock import StockError, apply_stock_changes, restore_hot_goods
+
+logger = logging.getLogger('django')
+
+PENDING_KEY = 'stock_pending'
+FLUSHING_KEY = 'stock_flushing'
+DEADLINES_KEY = 'stock_reservation_deadlines'
+# 加载库存时每条sql处理的sku数量
+BATCH_SIZE = 500
+
+# KEYS[1]: stock_pending  KEYS[2]: 订单预扣记录  KEYS[3]: 到期时间zset  KEYS[4..n+3]: 各sku的库存
+# ARGV[1]: order_id  ARGV[2]: 到期时间  ARGV[3..n+2]: sku_id  ARGV[n+3..2n+2]: 购买数量
+# 返回0表示成功, i表示第i个sku库存不足, -i表示第i个sku的库存还没有加载到redis
+RESERVE_STOCK_SCRIPT = """
+-- 同一个订单只预扣一次
+if redis.call('exists', KEYS[2]) == 1 then
+    return 0
+end
+local n = #KEYS - 3
+for i = 1, n do
+    local stock = redis.call('get', KEYS[i + 3])
+    if not stock then
+        return -i
+    end
+    if tonumber(stock) < tonumber(ARGV[n + i + 2]) then
+        return i
+    end
+end
+for i = 1, n do
+    local sku_id, count = ARGV[i + 2], ARGV[n + i + 2]
+    redis.call('decrby', KEYS[i + 3], count)
+    redis.call('hincrby', KEYS[1], sku_id, count)
+    redis.call('hset', KEYS[2], sku_id, count)
+end
+redis.call('zadd', KEYS[3], ARGV[2], ARGV[1])
+return 0
+"""
+
+# KEYS[1]: stock_pending  KEYS[2]: 订单预扣记录  KEYS[3]: 到期时间zset  KEYS[4..]: 各sku的库存
+# ARGV[1]: order_id  ARGV[2..]: sku_id
+# 预扣记录只能释放一次, 已经释放过返回0
+RELEASE_STOCK_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 0 then
+    redis.call('zrem', KEYS[3], ARGV[1])
+    return 0
+end
+for i = 4, #KEYS do
+    local sku_id = ARGV[i - 2]
+    local count = tonumber(redis.call('hget', KEYS[2], sku_id) or 0)
+    if redis.call('exists', KEYS[i]) == 1 then
+        redis.call('incrby', KEYS[i], count)
+    end
+    redis.call('hincrby', KEYS[1], sku_id, -count)
+end
+redis.call('del', KEYS[2])
+redis.call('zrem', KEYS[3], ARGV[1])
+return 1
+"""
+
+# KEYS[1]: stock_pending  KEYS[2]: stock_flushing  KEYS[3..n+2]: 各sku的库存
+# ARGV[1]: 是否覆盖已有的库存  ARGV[2..n+1]: sku_id  ARGV[n+2..2n+1]: 数据库中的库存
+LOAD_STOCK_SCRIPT = """
+local n = #KEYS - 2
+for i = 1, n do
+    if ARGV[1] == '1' or redis.call('exists', KEYS[i + 2]) == 0 then
+        local sku_id = ARGV[i + 1]
+        local pending = tonumber(redis.call('hget', KEYS[1], sku_id) or 0)
+        local flushing = tonumber(redis.call('hget', KEYS[2], sku_id) or 0)
+        redis.call('set', KEYS[i + 2], tonumber(ARGV[n + i + 1]) - pending - flushing)
+    end
+end
+return n
+"""
+
+# KEYS[1]: stock_pending  KEYS[2]: stock_flushing
+# 上次同步失败时stock_flushing还在, 继续同步它, 否则把stock_pending整体移到stock_flushing
+TAKE_PENDING_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 0 then
+    if redis.call('exists', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('rename', KEYS[1], KEYS[2])
+end
+return redis.call('hgetall', KEYS[2])
+"""
+
+
+def stock_key(sku_id):
+    return 'stock_%s' % sku_id
+
+
+def reservation_key(order_id):
+    return 'stock_reservation_%s' % order_id
+
+
+def load_stock(sku_ids=None, force=False):
+    """把数据库中的库存加载到redis
+    :param sku_ids: 为None时加载所有sku
+    :param force: 是否覆盖redis中已有的库存, 否则只加载redis中还没有的
+    :return: 处理的sku数量
+    """
+    redis_conn = get_redis_connection('inventory')
+    load = redis_conn.register_script(LOAD_STOCK_SCRIPT)
+    sku_qs = SKU.objects.order_by('id')
+    if sku_ids is not None:
+        sku_qs = sku_qs.filter(id__in=sku_ids)
+
+    count = 0
+    stocks = list(sku_qs.values_list('id', 'stock'))
+    for i in range(0, len(stocks), BATCH_SIZE):
+        batch = stocks[i:i + BATCH_SIZE]
+        keys = [PENDING_KEY, FLUSHING_KEY] + [stock_key(sku_id) for sku_id, _ in batch]
+        args = ['1' if force else '0'] + [sku_id for sku_id, _ in batch] + [stock for _, stock in batch]
+        count += load(keys=keys, args=args)
+    return count
+
+
+def reserve_redis_stock(order_id, cart_dict):
+    """在redis中预扣订单的库存
+    :param cart_dict: {sku_id: 购买数量}
+    :raise StockError: 库存不足或sku不存在
+    """
+    redis_conn = get_redis_connection('inventory')
+    reserve = redis_conn.register_script(RESERVE_STOCK_SCRIPT)
+    sku_ids = sorted(cart_dict)
+    keys = [PENDING_KEY, reservation_key(order_id), DEADLINES_KEY] + [stock_key(sku_id) for sku_id in sku_ids]
+    args = [order_id, time.time() + settings.ORDER_UNPAID_EXPIRES] + sku_ids + [cart_dict[i] for i in sku_ids]
+
+    # 库存没有加载到redis时, 从数据库加载后再扣一次
+    for _ in range(2):
+        result = reserve(keys=keys, args=args)
+        if result == 0:
+            return
+        if result > 0:
+            raise StockError(sku_ids[result - 1])
+        missing = [sku_id for sku_id in sku_ids if not redis_conn.exists(stock_key(sku_id))]
+        if not load_stock(missing):
+            raise StockError(sku_ids[-result - 1])
+    raise StockError(sku_ids[-result - 1])
+
+
+def confirm_reservation(order_id):
+    """订单已支付或货到付款, 预扣的库存不再释放"""
+    pl = get_redis_connection('inventory').pipeline()
+    pl.delete(reservation_key(order_id))
+    pl.zrem(DEADLINES_KEY, order_id)
+    pl.execute()
+
+
+def release_reservation(order_id):
+    """把订单预扣的库存还回redis, 并在下次同步时还回数据库
+    :return: 是否释放了库存
+    """
+    redis_conn = get_redis_connection('inventory')
+    sku_ids = [int(sku_id) for sku_id in redis_conn.hkeys(reservation_key(order_id))]
+    release = redis_conn.register_script(RELEASE_STOCK_SCRIPT)
+    keys = [PENDING_KEY, reservation_key(order_id), DEADLINES_KEY] + [stock_key(sku_id) for sku_id in sku_ids]
+    return bool(release(keys=keys, args=[order_id] + sku_ids))
+
+
+def reserved_order_ids(order_ids):
+    """还有预扣记录的订单, 它们的库存由预扣记录释放"""
+    pl = get_redis_connection('inventory').pipeline(transaction=False)
+    for order_id in order_ids:
+        pl.exists(reservation_key(order_id))
+    return {order_id for order_id, exists in zip(order_ids, pl.execute()) if exists}
+
+
+def release_expired_reservations(limit=500):
+    """取消到期仍未支付的订单并释放库存, 订单已支付或货到付款的只删除预扣记录
+    :return: 释放的订单数量
+    """
+    redis_conn = get_redis_connection('inventory')
+    order_ids = [order_id.decode() for order_id in
+                 redis_conn.zrangebyscore(DEADLINES_KEY, '-inf', time.time(), start=0, num=limit)]
+    if not order_ids:
+        return 0
+
+    status_dict = dict(OrderInfo.objects.filter(order_id__in=order_ids).values_list('order_id', 'status'))
+    count = 0
+    # 已经保存并计入热销排行的订单
+    cancelled_ids = []
+    for order_id in order_ids:
+        status = status_dict.get(order_id)
+        if status is None or status == OrderInfo.ORDER_STATUS_ENUM['UNPAID']:
+            # 订单没有保存成功, 或者状态从未支付改为已取消成功, 才释放库存, 避免和支付同时修改
+            cancelled = status is None or OrderInfo.objects.filter(
+                order_id=order_id, status=OrderInfo.ORDER_STATUS_ENUM['UNPAID']).update(
+                status=OrderInfo.ORDER_STATUS_ENUM['CANCELED'])
+            if cancelled:
+                if status is not None:
+                    cancelled_ids.append(order_id)
+                count += release_reservation(order_id)
+                continue
+        confirm_reservation(order_id)
+    restore_hot_goods(cancelled_ids)
+    return count
+
+
+def reconcile_stock():
+    """把redis中累计的扣减量批量同步到数据库的库存和销量
+    :return: 同步的sku数量
+    """
+    redis_conn = get_redis_connection('inventory')
+    take_pending = redis_conn.register_script(TAKE_PENDING_SCRIPT)
+    pending = take_pending(keys=[PENDING_KEY, FLUSHING_KEY])
+    changes = {}
+    for i in range(0, len(pending), 2):
+        count = int(pending[i + 1])
+        if count:
+            changes[int(pending[i])] = count
+    if changes:
+        apply_stock_changes(changes)
+    # 数据库提交之后再删除, 同步失败时下次继续同步
+    redis_conn.delete(FLUSHING_KEY)
+    return len(changes)
@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django import db
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django_redis import get_redis_connection
+
+from goods.models import SKU
+from orders.inventory import RESERVE_STOCK_SCRIPT
+
+# 压测使用单独的key, 不影响真实的库存
+BENCH_PREFIX = 'bench_'
+
+
+def _mysql_order(sku_id):
+    """在事务中用条件UPDATE扣一件库存, 最后回滚, 不修改真实数据"""
+    with transaction.atomic():
+        result = SKU.objects.filter(id=sku_id, stock__gte=1).update(stock=F('stock') - 1, sales=F('sales') + 1)
+        transaction.set_rollback(True)
+    return result
+
+
+def _run(worker, orders, concurrency):
+    def run_batch(count):
+        try:
+            for _ in range(count):
+                worker()
+        finally:
+            db.connection.close()
+
+    batches = [orders // concurrency + (1 if i < orders % concurrency else 0) for i in range(concurrency)]
+    start = time.time()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(run_batch, batches))
+    return orders / (time.time() - start)
+
+
+class Command(BaseCommand):
+    help = '对比单个热门sku在数据库扣库存和redis预扣库存两种模式下每秒能处理的订单数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sku_id', type=int, help='压测的sku')
+        parser.add_argument('--orders', type=int, default=2000, help='每种模式的下单次数')
+        parser.add_argument('--concurrency', type=int, default=20, help='并发线程数')
+
+    def handle(self, *args, **options):
+        sku_id, orders, concurrency = options['sku_id'], options['orders'], options['concurrency']
+        if not SKU.objects.filter(id=sku_id, stock__gte=1).exists():
+            raise CommandError('sku %s 不存在或没有库存' % sku_id)
+
+        mysql_ops = _run(lambda: _mysql_order(sku_id), orders, concurrency)
+
+        redis_conn = get_redis_connection('inventory')
+        reserve = redis_conn.register_script(RESERVE_STOCK_SCRIPT)
+        stock_key = BENCH_PREFIX + 'stock_%s' % sku_id
+        pending_key = BENCH_PREFIX + 'stock_pending'
+        deadlines_key = BENCH_PREFIX + 'stock_reservation_deadlines'
+        redis_conn.set(stock_key, orders)
+        counter = iter(range(orders))
+
+        def redis_order():
+            order_id = next(counter)
+            reservation_key = BENCH_PREFIX + 'stock_reservation_%s' % order_id
+            reserve(keys=[pending_key, reservation_key, deadlines_key, stock_key],
+                    args=[order_id, time.time(), sku_id, 1])
+
+        try:
+            redis_ops = _run(redis_order, orders, concurrency)
+        finally:
+            redis_conn.delete(stock_key, pending_key, deadlines_key,
+                              *[BENCH_PREFIX + 'stock_reservation_%s' % i for i in range(orders)])
+
+        self.stdout.write('%-8s %12s' % ('mode', 'orders/s'))
+        self.stdout.write('%-8s %12.1f' % ('mysql', mysql_ops))
+        self.stdout.write('%-8s %12.1f' % ('redis', redis_ops))
+        self.stdout.write('只比较扣库存这一步, 两种模式下保存订单和订单商品的开销相同')
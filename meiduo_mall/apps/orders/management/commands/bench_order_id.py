@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.order_id import OrderIdGenerator
+
+
+def _old_order_id(user_id):
+    """原来的订单号: 秒级时间 + 用户id"""
+    return time.strftime('%Y%m%d%H%M%S') + ('%09d' % user_id)
+
+
+class Command(BaseCommand):
+    help = '测试订单号生成器的吞吐量, 并检查生成的订单号不重复且递增'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=200000, help='每种情况生成的订单号数量')
+        parser.add_argument('--threads', type=int, default=8, help='多线程测试的线程数')
+
+    def handle(self, *args, **options):
+        number, threads = options['number'], options['threads']
+        self.stdout.write('%-20s %14s %12s' % ('case', 'ids/s', 'duplicates'))
+
+        # 单线程: 检查递增
+        generator = OrderIdGenerator(1)
+        start = time.time()
+        ids = [generator.next_id(i) for i in range(number)]
+        elapsed = time.time() - start
+        if any(len(order_id) != 26 or not order_id.isdigit() for order_id in ids):
+            raise CommandError('订单号格式错误')
+        if any(ids[i][:24] >= ids[i + 1][:24] for i in range(len(ids) - 1)):
+            raise CommandError('订单号没有按生成顺序递增')
+        self.stdout.write('%-20s %14.0f %12d' % ('single thread', number / elapsed, number - len(set(ids))))
+
+        # 多线程共用一个生成器
+        generator = OrderIdGenerator(2)
+        per_thread = number // threads
+        start = time.time()
+        with ThreadPoolExecutor(threads) as executor:
+            results = list(executor.map(lambda n: [generator.next_id(7) for _ in range(n)], [per_thread] * threads))
+        elapsed = time.time() - start
+        ids = [order_id for result in results for order_id in result]
+        self.stdout.write('%-20s %14.0f %12d' % ('%d threads' % threads, len(ids) / elapsed, len(ids) - len(set(ids))))
+
+        # 两个机器号同时为同一用户生成
+        generators = [OrderIdGenerator(3), OrderIdGenerator(4)]
+        ids = [generators[i % 2].next_id(7) for i in range(number)]
+        self.stdout.write('%-20s %14s %12d' % ('2 workers', '-', number - len(set(ids))))
+
+        # 原来的方式, 同一用户同一秒内下单就会重复
+        start = time.time()
+        ids = [_old_order_id(7) for _ in range(number)]
+        elapsed = time.time() - start
+        self.stdout.write('%-20s %14.0f %12d' % ('old (same user)', number / elapsed, number - len(set(ids))))
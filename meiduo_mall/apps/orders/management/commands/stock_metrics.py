@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from orders.stock import STOCK_METRICS_KEY, get_stock_metrics
+
+METRIC_NAMES = [
+    ('conflicts', '库存不足'),
+    ('deadlocks', '死锁/锁等待超时'),
+    ('retries', '重试'),
+    ('failures', '重试后仍失败'),
+]
+
+
+class Command(BaseCommand):
+    help = '查看下单扣库存的统计: 库存不足、死锁/锁等待超时、重试和重试后仍失败的次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='输出后清零')
+
+    def handle(self, *args, **options):
+        metrics = get_stock_metrics()
+        for name, label in METRIC_NAMES:
+            self.stdout.write('%-10s %10d  %s' % (name, metrics.get(name, 0), label))
+        if options['reset']:
+            get_redis_connection('default').delete(STOCK_METRICS_KEY)
+            self.stdout.write(self.style.SUCCESS('已清零'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from orders.inventory import load_stock, reconcile_stock
+
+
+class Command(BaseCommand):
+    help = '把数据库中的sku库存加载到redis, 开启redis预扣库存模式前执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='覆盖redis中已有的库存, 在后台直接修改过库存后使用')
+
+    def handle(self, *args, **options):
+        # 先把还没同步的扣减量写入数据库, 再用数据库库存计算redis库存
+        reconcile_stock()
+        count = load_stock(force=options['force'])
+        self.stdout.write(self.style.SUCCESS('已加载%d个sku的库存' % count))
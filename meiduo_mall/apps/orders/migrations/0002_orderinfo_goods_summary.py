@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderinfo',
+            name='goods_summary',
+            field=models.TextField(default='', verbose_name='订单商品摘要'),
+        ),
+        migrations.AlterIndexTogether(
+            name='orderinfo',
+            index_together=set([('user', 'create_time')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_orderinfo_goods_summary'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='orderinfo',
+            index_together=set([('user', 'create_time'), ('status', 'create_time')]),
+        ),
+    ]
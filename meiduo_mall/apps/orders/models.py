@@ -18,7 +18,8 @@ class OrderInfo(BaseModel):
         "UNSEND": 2,
         "UNRECEIVED": 3,
         "UNCOMMENT": 4,
-        "FINISHED": 5
+        "FINISHED": 5,
+        "CANCELED": 6
     }
     ORDER_STATUS_CHOICES = (
         (1, "待支付"),
@@ -36,11 +37,14 @@ class OrderInfo(BaseModel):
     freight = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="运费")
     pay_method = models.SmallIntegerField(choices=PAY_METHOD_CHOICES, default=1, verbose_name="支付方式")
     status = models.SmallIntegerField(choices=ORDER_STATUS_CHOICES, default=1, verbose_name="订单状态")
+    goods_summary = models.TextField(default="", verbose_name="订单商品摘要")
 
     class Meta:
         db_table = "tb_order_info"
         verbose_name = '订单基本信息'
         verbose_name_plural = verbose_name
+        # 订单列表按(create_time, order_id)游标分页, 超时未支付的订单按(status, create_time)扫描
+        index_together = [('user', 'create_time'), ('status', 'create_time')]
 
     def __str__(self):
         return self.order_id
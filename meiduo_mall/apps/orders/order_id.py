@@ -0,0 +1,191 @@
+"""订单号生成
+
+参考Snowflake, 在进程内生成按时间递增且不重复的订单号, 不访问数据库和redis
+订单号为26位数字, 仍可用在支付等只接受数字的url中:
+    年月日时分秒(14位) + 毫秒(3位) + 机器号(3位) + 毫秒内序号(4位) + 用户分片(2位)
+
+同一毫秒内序号用完, 或者系统时间回拨时, 沿用上一个毫秒继续往后排, 保证单个进程内递增
+
+不同进程的机器号必须不同, 每个进程第一次生成订单号时分配:
+- 设置了环境变量 ORDER_ID_WORKER_ID 时使用它, 由部署脚本保证每个进程不同
+  (uwsgi、celery等由一个主进程fork出多个worker时, worker共用同一个环境变量, 不要设置, 使用redis租用)
+- 否则从redis租用一个机器号: order_id_worker_<id> 记录租用它的进程, 生成订单号时定期续租,
+  续租失败(进程长时间空闲, 租约已过期)时重新租用, 不会和其他进程同时使用同一个机器号;
+  进程退出时释放租约, 异常退出的进程的租约过期后, 对应的机器号可以被其他进程重新租用
+两种方式都不可用时抛出异常, 不生成可能重复的订单号
+"""
+import atexit
+import os
+import threading
+import time
+import uuid
+
+from django.core.exceptions import ImproperlyConfigured
+from django_redis import get_redis_connection
+
+MAX_WORKER_ID = 999
+MAX_SEQUENCE = 9999
+# 用户分片数, 同一用户的订单号末两位相同, 按用户分库分表时可以直接从订单号得到分片
+USER_SHARDS = 100
+
+WORKER_ID_ENV = 'ORDER_ID_WORKER_ID'
+WORKER_SEQUENCE_KEY = 'order_id_worker_sequence'
+# 机器号租约的有效期和续租间隔(秒), 续租间隔必须明显小于有效期
+WORKER_LEASE_EXPIRES = 3600
+WORKER_LEASE_RENEW = 600
+
+# 只续租自己持有的租约
+RENEW_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# 只释放自己持有的租约
+RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _lease_key(worker_id):
+    return 'order_id_worker_%s' % worker_id
+
+
+class WorkerLease(object):
+    """从redis租用的机器号"""
+
+    def __init__(self, redis_conn):
+        self.redis_conn = redis_conn
+        self.token = uuid.uuid4().hex
+        self.worker_id = None
+        self.renewed_at = 0
+
+    def acquire(self):
+        """从轮流分配的起点开始依次尝试各个机器号, 已释放和已过期的机器号都可以租用,
+        全部被占用时抛出ImproperlyConfigured
+        """
+        # 起点轮流分配, 同时启动的进程不会都从同一个机器号开始尝试
+        start = self.redis_conn.incr(WORKER_SEQUENCE_KEY)
+        for offset in range(MAX_WORKER_ID + 1):
+            worker_id = (start + offset) % (MAX_WORKER_ID + 1)
+            if self.redis_conn.set(_lease_key(worker_id), self.token, nx=True, ex=WORKER_LEASE_EXPIRES):
+                self.worker_id = worker_id
+                self.renewed_at = time.time()
+                return worker_id
+        raise ImproperlyConfigured('没有可用的订单号机器号, 同时运行的进程数超过了%d' % (MAX_WORKER_ID + 1))
+
+    def renew(self):
+        """到了续租时间时续租
+        :return: 租约是否仍然有效
+        """
+        if time.time() - self.renewed_at < WORKER_LEASE_RENEW:
+            return True
+        renew = self.redis_conn.register_script(RENEW_LEASE_SCRIPT)
+        if not renew(keys=[_lease_key(self.worker_id)], args=[self.token, WORKER_LEASE_EXPIRES]):
+            return False
+        self.renewed_at = time.time()
+        return True
+
+    def release(self):
+        """释放租约, 租约已经被其他进程租用时不影响它"""
+        if self.worker_id is None:
+            return
+        release = self.redis_conn.register_script(RELEASE_LEASE_SCRIPT)
+        release(keys=[_lease_key(self.worker_id)], args=[self.token])
+        self.worker_id = None
+
+
+def env_worker_id():
+    """环境变量中配置的机器号, 没有配置时返回None"""
+    value = os.environ.get(WORKER_ID_ENV)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured('环境变量%s必须是0到%d之间的整数' % (WORKER_ID_ENV, MAX_WORKER_ID))
+
+
+class OrderIdGenerator(object):
+    """线程安全的订单号生成器"""
+
+    def __init__(self, worker_id):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError('机器号必须在0到%d之间' % MAX_WORKER_ID)
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+        self._second = None
+        self._second_prefix = ''
+
+    def next_id(self, user_id=0):
+        with self._lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                self._last_ms += 1
+                self._sequence = 0
+            timestamp_ms, sequence = self._last_ms, self._sequence
+
+            # 同一秒内的前缀只格式化一次
+            second = timestamp_ms // 1000
+            if second != self._second:
+                self._second = second
+                self._second_prefix = time.strftime('%Y%m%d%H%M%S', time.localtime(second))
+            prefix = self._second_prefix
+
+        return '%s%03d%03d%04d%02d' % (prefix, timestamp_ms % 1000, self.worker_id, sequence, user_id % USER_SHARDS)
+
+
+_generator = None
+_generator_pid = None
+_lease = None
+_generator_lock = threading.Lock()
+
+
+def _get_generator():
+    """当前进程的生成器, fork出的子进程和租约失效时重新分配机器号"""
+    global _generator, _generator_pid, _lease
+    pid = os.getpid()
+    with _generator_lock:
+        if _generator is not None and _generator_pid == pid and (_lease is None or _lease.renew()):
+            return _generator
+
+        worker_id = env_worker_id()
+        if worker_id is None:
+            _lease = WorkerLease(get_redis_connection('default'))
+            worker_id = _lease.acquire()
+        else:
+            _lease = None
+        _generator = OrderIdGenerator(worker_id)
+        _generator_pid = pid
+        return _generator
+
+
+def generate_order_id(user_id):
+    """生成订单号"""
+    return _get_generator().next_id(user_id)
+
+
+@atexit.register
+def release_worker_lease():
+    """进程退出时释放本进程租用的机器号, fork出的子进程不会释放父进程的租约"""
+    global _lease
+    with _generator_lock:
+        if _lease is None or _generator_pid != os.getpid():
+            return
+        try:
+            _lease.release()
+        except Exception:
+            # redis不可用时等租约过期
+            pass
+        _lease = None
@@ -0,0 +1,159 @@
+"""异步下单队列
+
+开启 settings.ORDER_ASYNC_COMMIT 后, 提交订单只把下单请求放入redis队列并返回ticket,
+由celery任务按批处理队列, 浏览器用ticket查询下单结果
+
+order_queue_<shard>: list 待处理的下单请求, 同一用户的请求总在同一个分片中, 按提交顺序处理
+order_queue_<shard>_processing: 正在处理的一批请求, worker中断时下次先处理这一批
+order_queue_<shard>_lock: 每个分片同时只有一个worker处理, 分片数就是下单的数据库并发上限
+order_ticket_<ticket>: hash 下单结果 {user_id, order_id, status, code, errmsg}
+order_ticket_done_<ticket>: list 下单完成的通知, 长轮询时阻塞等待
+order_idempotency_<user_id>_<key>: 幂等键对应的ticket, 重复提交时返回同一个ticket
+order_idempotency_order_<user_id>_<key>: 同步下单时幂等键对应的订单号, 重复提交时返回同一个订单
+"""
+import json
+import uuid
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from meiduo_mall.utils.redis_queue import drain_queue
+from meiduo_mall.utils.response_code import RETCODE
+from .models import OrderInfo
+from .utils import commit_order
+
+# 每批处理的下单请求数量
+ORDER_QUEUE_BATCH_SIZE = 20
+# 处理队列的锁的过期时间(秒), 每处理完一批续期一次
+ORDER_QUEUE_LOCK_EXPIRES = 60
+# ticket和幂等键的保存时间(秒)
+ORDER_TICKET_EXPIRES = 24 * 3600
+
+TICKET_QUEUED = 'queued'
+TICKET_DONE = 'done'
+
+
+def order_queue_shard(user_id):
+    return user_id % settings.ORDER_QUEUE_SHARDS
+
+
+def _ticket_key(ticket):
+    return 'order_ticket_%s' % ticket
+
+
+def _ticket_done_key(ticket):
+    return 'order_ticket_done_%s' % ticket
+
+
+def _idempotency_key(user_id, idempotency_key):
+    return 'order_idempotency_%s_%s' % (user_id, idempotency_key)
+
+
+def _idempotent_order_key(user_id, idempotency_key):
+    return 'order_idempotency_order_%s_%s' % (user_id, idempotency_key)
+
+
+def claim_idempotent_order(user_id, idempotency_key, order_id):
+    """同步下单前占用幂等键
+    :return: 幂等键已经提交过时返回之前的订单号, 否则返回None
+    """
+    if not idempotency_key:
+        return None
+    redis_conn = get_redis_connection('default')
+    key = _idempotent_order_key(user_id, idempotency_key)
+    while True:
+        if redis_conn.set(key, order_id, nx=True, ex=ORDER_TICKET_EXPIRES):
+            return None
+        previous = redis_conn.get(key)
+        # 读取之前幂等键刚好因下单失败被释放时重新占用
+        if previous is not None:
+            return previous.decode()
+
+
+def release_idempotent_order(user_id, idempotency_key):
+    """同步下单失败后释放幂等键, 可以用同一个幂等键重新提交"""
+    if idempotency_key:
+        get_redis_connection('default').delete(_idempotent_order_key(user_id, idempotency_key))
+
+
+def get_idempotent_ticket(user_id, idempotency_key):
+    """幂等键已经提交过时返回之前的ticket, 否则返回None"""
+    if not idempotency_key:
+        return None
+    ticket = get_redis_connection('default').get(_idempotency_key(user_id, idempotency_key))
+    return ticket.decode() if ticket is not None else None
+
+
+def enqueue_order(order_id, user_id, address_id, pay_method, cart_dict, idempotency_key=None):
+    """把下单请求放入用户所在分片的队列
+    :return: (ticket, 是否新放入队列), 幂等键重复时返回之前的ticket
+    """
+    redis_conn = get_redis_connection('default')
+    ticket = uuid.uuid4().hex
+    if idempotency_key:
+        idempotency_redis_key = _idempotency_key(user_id, idempotency_key)
+        if not redis_conn.set(idempotency_redis_key, ticket, nx=True, ex=ORDER_TICKET_EXPIRES):
+            previous = redis_conn.get(idempotency_redis_key)
+            if previous is not None:
+                return previous.decode(), False
+
+    payload = json.dumps({
+        'ticket': ticket,
+        'order_id': order_id,
+        'user_id': user_id,
+        'address_id': address_id,
+        'pay_method': pay_method,
+        'cart': [[sku_id, count] for sku_id, count in cart_dict.items()],
+    })
+    pl = redis_conn.pipeline()
+    pl.hmset(_ticket_key(ticket), {'user_id': user_id, 'order_id': order_id, 'status': TICKET_QUEUED})
+    pl.expire(_ticket_key(ticket), ORDER_TICKET_EXPIRES)
+    pl.rpush('order_queue_%s' % order_queue_shard(user_id), payload)
+    pl.execute()
+    return ticket, True
+
+
+def get_ticket(ticket, user_id, wait=0):
+    """查询下单结果
+    :param wait: 还在排队时最多阻塞等待的秒数
+    :return: {'order_id', 'status', 'code', 'errmsg'}, ticket不存在或不属于该用户时返回None
+    """
+    redis_conn = get_redis_connection('default')
+    ticket_dict = {key.decode(): value.decode() for key, value in redis_conn.hgetall(_ticket_key(ticket)).items()}
+    if ticket_dict.get('user_id') != str(user_id):
+        return None
+    if ticket_dict['status'] == TICKET_QUEUED and wait > 0:
+        if redis_conn.blpop(_ticket_done_key(ticket), timeout=wait):
+            return get_ticket(ticket, user_id)
+    return ticket_dict
+
+
+def _finish_ticket(redis_conn, ticket, code, errmsg):
+    pl = redis_conn.pipeline()
+    pl.hmset(_ticket_key(ticket), {'status': TICKET_DONE, 'code': code, 'errmsg': errmsg})
+    pl.expire(_ticket_key(ticket), ORDER_TICKET_EXPIRES)
+    pl.rpush(_ticket_done_key(ticket), 1)
+    pl.expire(_ticket_done_key(ticket), 60)
+    pl.execute()
+
+
+def _process_batch(redis_conn, payloads, recovered):
+    for payload in payloads:
+        order = json.loads(payload.decode())
+        # 上次中断的一批中可能有已经保存到数据库的订单, 不能重复下单
+        if recovered and OrderInfo.objects.filter(order_id=order['order_id']).exists():
+            code, errmsg = RETCODE.OK, '下单成功'
+        else:
+            code, errmsg = commit_order(order['order_id'], order['user_id'], order['address_id'],
+                                        order['pay_method'], dict(order['cart']))
+        _finish_ticket(redis_conn, order['ticket'], code, errmsg)
+
+
+def drain_order_queue(shard):
+    """处理一个分片中的所有下单请求, 已经有worker在处理时直接返回
+    :return: 处理的请求数量
+    """
+    redis_conn = get_redis_connection('default')
+    return drain_queue(redis_conn, 'order_queue_%s' % shard,
+                       lambda payloads, recovered: _process_batch(redis_conn, payloads, recovered),
+                       ORDER_QUEUE_BATCH_SIZE, ORDER_QUEUE_LOCK_EXPIRES)
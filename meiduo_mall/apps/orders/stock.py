@@ -0,0 +1,147 @@
+"""下单扣减库存
+
+每个sku一条 UPDATE tb_sku SET stock = stock - n, sales = sales + n WHERE id = x AND stock >= n
+由数据库保证扣减的原子性, 不再先查询库存再比较, 也就不需要乐观锁重试
+只有遇到死锁或锁等待超时时才整体重试, 次数有限并带退避
+"""
+import logging
+import random
+import time
+
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django_redis import get_redis_connection
+
+from goods.hot_goods import incr_hot_goods
+from goods.models import SKU, SPU
+from .models import OrderGoods
+
+logger = logging.getLogger('django')
+
+# 遇到死锁/锁等待超时时的最大重试次数和退避基数(秒)
+STOCK_MAX_RETRIES = 3
+STOCK_RETRY_BACKOFF = 0.05
+# mysql死锁和锁等待超时的错误码
+RETRYABLE_ERROR_CODES = (1205, 1213)
+# 扣库存的统计数据
+STOCK_METRICS_KEY = 'order_stock_metrics'
+# 批量修改库存时每条sql处理的sku数量
+STOCK_BATCH_SIZE = 500
+
+
+class StockError(Exception):
+    """库存不足"""
+
+    def __init__(self, sku_id):
+        super().__init__('sku %s 库存不足' % sku_id)
+        self.sku_id = sku_id
+
+
+def incr_stock_metric(name, amount=1):
+    """累加扣库存的统计: conflicts 库存不足, retries 重试, deadlocks 死锁/锁超时, failures 重试后仍失败"""
+    try:
+        get_redis_connection('default').hincrby(STOCK_METRICS_KEY, name, amount)
+    except Exception as e:
+        logger.error('记录库存统计失败: %s' % e)
+
+
+def get_stock_metrics():
+    """读取扣库存的统计数据"""
+    metrics = get_redis_connection('default').hgetall(STOCK_METRICS_KEY)
+    return {name.decode(): int(value) for name, value in metrics.items()}
+
+
+def case_by_id(values):
+    """{id: 数量} -> CASE WHEN id=.. THEN .. END, 用来在一条UPDATE中给多行加减不同的数量"""
+    return Case(*[When(id=pk, then=Value(value)) for pk, value in values.items()], output_field=IntegerField())
+
+
+def reserve_stock(order, cart_dict, deduct_stock=True):
+    """在调用方的事务中扣减库存、累加销量并批量创建订单商品
+    :param cart_dict: {sku_id: 购买数量}
+    :param deduct_stock: 库存已在redis中预扣时为False, 只创建订单商品
+    :return: {sku_id: sku} 下单的sku
+    :raise StockError: 有sku不存在或库存不足, 调用方需要回滚事务
+    """
+    # 按sku_id顺序扣减, 保证并发下单时加锁顺序一致, 避免死锁
+    sku_ids = sorted(cart_dict)
+    skus = SKU.objects.in_bulk(sku_ids)
+
+    for sku_id in sku_ids:
+        if sku_id not in skus:
+            raise StockError(sku_id)
+
+    if deduct_stock:
+        _deduct_stock(skus, sku_ids, cart_dict)
+
+    OrderGoods.objects.bulk_create([
+        OrderGoods(order=order, sku=skus[sku_id], count=cart_dict[sku_id], price=skus[sku_id].price)
+        for sku_id in sku_ids
+    ])
+    return skus
+
+
+def _deduct_stock(skus, sku_ids, cart_dict):
+    spu_sales = {}
+    for sku_id in sku_ids:
+        count = cart_dict[sku_id]
+        result = SKU.objects.filter(id=sku_id, stock__gte=count).update(
+            stock=F('stock') - count, sales=F('sales') + count)
+        if result == 0:
+            incr_stock_metric('conflicts')
+            raise StockError(sku_id)
+
+        spu_id = skus[sku_id].spu_id
+        spu_sales[spu_id] = spu_sales.get(spu_id, 0) + count
+
+    # 所有spu的销量用一条UPDATE累加
+    SPU.objects.filter(id__in=spu_sales).update(sales=F('sales') + case_by_id(spu_sales))
+
+
+def apply_stock_changes(changes):
+    """按 {sku_id: 扣减量} 更新sku的库存和销量以及spu的销量, 扣减量为负数时表示还回库存"""
+    spu_ids = dict(SKU.objects.filter(id__in=changes).values_list('id', 'spu_id'))
+    spu_sales = {}
+    for sku_id, count in changes.items():
+        if sku_id in spu_ids:
+            spu_sales[spu_ids[sku_id]] = spu_sales.get(spu_ids[sku_id], 0) + count
+
+    # 和下单一样按sku_id顺序加锁
+    sku_ids = sorted(spu_ids)
+    with transaction.atomic():
+        for i in range(0, len(sku_ids), STOCK_BATCH_SIZE):
+            batch = {sku_id: changes[sku_id] for sku_id in sku_ids[i:i + STOCK_BATCH_SIZE]}
+            SKU.objects.filter(id__in=batch).update(stock=F('stock') - case_by_id(batch),
+                                                    sales=F('sales') + case_by_id(batch))
+        spu_sales = {spu_id: count for spu_id, count in spu_sales.items() if count}
+        if spu_sales:
+            SPU.objects.filter(id__in=spu_sales).update(sales=F('sales') + case_by_id(spu_sales))
+
+
+def restore_hot_goods(order_ids):
+    """订单取消后从热销排行中减去这些订单的销量, 在订单取消的事务提交之后调用"""
+    if not order_ids:
+        return
+    counts = OrderGoods.objects.filter(order_id__in=order_ids).values('sku_id', 'sku__category_id').annotate(
+        total=Sum('count'))
+    try:
+        incr_hot_goods([(item['sku__category_id'], item['sku_id'], -item['total']) for item in counts])
+    except Exception as e:
+        # 排行只用于展示, 下次重建时会按数据库中的销量修正
+        logger.error('热销排行减去取消订单的销量失败: %s' % e)
+
+
+def run_with_retry(func, *args, **kwargs):
+    """执行一个包含事务的函数, 遇到死锁或锁等待超时时按指数退避重试"""
+    for attempt in range(STOCK_MAX_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as e:
+            if not e.args or e.args[0] not in RETRYABLE_ERROR_CODES:
+                raise
+            incr_stock_metric('deadlocks')
+            if attempt == STOCK_MAX_RETRIES:
+                incr_stock_metric('failures')
+                raise
+            incr_stock_metric('retries')
+            time.sleep(STOCK_RETRY_BACKOFF * (2 ** attempt) * (1 + random.random()))
@@ -1,3 +1,248 @@
-from django.test import TestCase
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError
+from django.test import SimpleTestCase
+
+from . import order_id
+from .order_id import MAX_SEQUENCE, MAX_WORKER_ID, OrderIdGenerator, WorkerLease
+from .order_queue import claim_idempotent_order, release_idempotent_order
+from .stock import STOCK_MAX_RETRIES, get_stock_metrics, run_with_retry
+
+
+class FakeRedis(object):
+    """只实现机器号租约、幂等键和扣库存统计用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+
+    def hincrby(self, key, field, amount=1):
+        hash_dict = self.data.setdefault(key, {})
+        hash_dict[field.encode()] = hash_dict.get(field.encode(), 0) + amount
+        return hash_dict[field.encode()]
+
+    def hgetall(self, key):
+        return {field: str(value).encode() for field, value in self.data.get(key, {}).items()}
+
+    def get(self, key):
+        value = self.data.get(key)
+        return value.encode() if isinstance(value, str) else value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = self.data.get(key, 0) + 1
+        return self.data[key]
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def register_script(self, script):
+        def compare_and_call(keys, args):
+            if self.data.get(keys[0]) != args[0]:
+                return 0
+            if "'del'" in script:
+                del self.data[keys[0]]
+            return 1
+        return compare_and_call
+
+
+class OrderIdGeneratorTest(SimpleTestCase):
+
+    def test_format(self):
+        generated = OrderIdGenerator(12).next_id(1234)
+        self.assertEqual(len(generated), 26)
+        self.assertTrue(generated.isdigit())
+        self.assertEqual(generated[17:20], '012')
+        self.assertEqual(generated[-2:], '34')
+
+    def test_invalid_worker_id(self):
+        with self.assertRaises(ValueError):
+            OrderIdGenerator(MAX_WORKER_ID + 1)
+
+    def test_increasing_and_unique(self):
+        generator = OrderIdGenerator(1)
+        ids = [generator.next_id(7) for _ in range(50000)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+
+    def test_sequence_overflow_borrows_next_ms(self):
+        generator = OrderIdGenerator(1)
+        with mock.patch('time.time', return_value=1500000000.0):
+            ids = [generator.next_id(7) for _ in range(MAX_SEQUENCE + 2)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids[-1][14:17], '001')
+
+    def test_clock_moving_backwards(self):
+        generator = OrderIdGenerator(1)
+        with mock.patch('time.time', return_value=1500000001.0):
+            first = generator.next_id(7)
+        with mock.patch('time.time', return_value=1500000000.0):
+            second = generator.next_id(7)
+        self.assertLess(first, second)
+
+    def test_threads_share_generator(self):
+        generator = OrderIdGenerator(2)
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda n: [generator.next_id(7) for _ in range(n)], [20000] * 8))
+        ids = [generated for result in results for generated in result]
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_workers_do_not_collide(self):
+        generators = [OrderIdGenerator(3), OrderIdGenerator(4)]
+        ids = [generators[i % 2].next_id(7) for i in range(50000)]
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_throughput(self):
+        # 实测单线程约50万个/秒, 这里只防止明显的性能退化
+        generator = OrderIdGenerator(5)
+        number = 100000
+        start = time.time()
+        for _ in range(number):
+            generator.next_id(7)
+        self.assertGreater(number / (time.time() - start), 50000)
+
+
+class WorkerIdTest(SimpleTestCase):
+
+    def setUp(self):
+        order_id._generator = None
+        order_id._lease = None
+
+    def tearDown(self):
+        order_id._generator = None
+        order_id._lease = None
+
+    def test_env_worker_id(self):
+        with mock.patch.dict(os.environ, {'ORDER_ID_WORKER_ID': '42'}):
+            self.assertEqual(order_id.generate_order_id(7)[17:20], '042')
+
+    def test_invalid_env_worker_id(self):
+        with mock.patch.dict(os.environ, {'ORDER_ID_WORKER_ID': 'abc'}):
+            with self.assertRaises(ImproperlyConfigured):
+                order_id.generate_order_id(7)
+
+    def test_leases_are_unique(self):
+        redis_conn = FakeRedis()
+        worker_ids = {WorkerLease(redis_conn).acquire() for _ in range(MAX_WORKER_ID + 1)}
+        self.assertEqual(len(worker_ids), MAX_WORKER_ID + 1)
+        with self.assertRaises(ImproperlyConfigured):
+            WorkerLease(redis_conn).acquire()
+
+    def test_released_and_expired_leases_are_reused(self):
+        redis_conn = FakeRedis()
+        leases = [WorkerLease(redis_conn) for _ in range(MAX_WORKER_ID + 1)]
+        for lease in leases:
+            lease.acquire()
+        released_id = leases[10].worker_id
+        leases[10].release()
+        # 过期的租约在redis中已经不存在
+        expired_id = leases[20].worker_id
+        del redis_conn.data['order_id_worker_%s' % expired_id]
+        self.assertEqual({WorkerLease(redis_conn).acquire(), WorkerLease(redis_conn).acquire()},
+                         {released_id, expired_id})
+
+    def test_release_keeps_other_lease(self):
+        redis_conn = FakeRedis()
+        lease = WorkerLease(redis_conn)
+        worker_id = lease.acquire()
+        redis_conn.data['order_id_worker_%s' % worker_id] = 'other'
+        lease.release()
+        self.assertEqual(redis_conn.data['order_id_worker_%s' % worker_id], 'other')
+
+    def test_release_at_exit(self):
+        redis_conn = FakeRedis()
+        with mock.patch.dict(os.environ, {'ORDER_ID_WORKER_ID': ''}), \
+                mock.patch.object(order_id, 'get_redis_connection', return_value=redis_conn):
+            worker_id = int(order_id.generate_order_id(7)[17:20])
+            # fork出的子进程不释放父进程的租约
+            with mock.patch('os.getpid', return_value=-1):
+                order_id.release_worker_lease()
+            self.assertIn('order_id_worker_%s' % worker_id, redis_conn.data)
+            order_id.release_worker_lease()
+        self.assertNotIn('order_id_worker_%s' % worker_id, redis_conn.data)
+
+    def test_lost_lease_is_replaced(self):
+        redis_conn = FakeRedis()
+        with mock.patch.dict(os.environ, {'ORDER_ID_WORKER_ID': ''}), \
+                mock.patch.object(order_id, 'get_redis_connection', return_value=redis_conn):
+            first = order_id.generate_order_id(7)[17:20]
+            # 租约过期后被其他进程租走
+            lease = order_id._lease
+            lease.renewed_at = 0
+            redis_conn.data['order_id_worker_%s' % lease.worker_id] = 'other'
+            second = order_id.generate_order_id(7)[17:20]
+        self.assertNotEqual(first, second)
+
+
+class StockRetryTest(SimpleTestCase):
+
+    def setUp(self):
+        self.redis_conn = FakeRedis()
+        patchers = [mock.patch('orders.stock.get_redis_connection', return_value=self.redis_conn),
+                    mock.patch('orders.stock.time.sleep')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_deadlock_retried(self):
+        calls = []
+
+        def create_order():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError(1213, 'Deadlock found when trying to get lock')
+            return 'ok'
+
+        self.assertEqual(run_with_retry(create_order), 'ok')
+        self.assertEqual(get_stock_metrics(), {'deadlocks': 1, 'retries': 1})
+
+    def test_lock_wait_timeout_gives_up(self):
+        def create_order():
+            raise OperationalError(1205, 'Lock wait timeout exceeded')
+
+        with self.assertRaises(OperationalError):
+            run_with_retry(create_order)
+        self.assertEqual(get_stock_metrics(), {'deadlocks': STOCK_MAX_RETRIES + 1, 'retries': STOCK_MAX_RETRIES,
+                                               'failures': 1})
+
+    def test_other_errors_not_retried(self):
+        def create_order():
+            raise OperationalError(2006, 'MySQL server has gone away')
+
+        with self.assertRaises(OperationalError):
+            run_with_retry(create_order)
+        self.assertEqual(get_stock_metrics(), {})
+
+
+class IdempotentOrderTest(SimpleTestCase):
+
+    def setUp(self):
+        self.redis_conn = FakeRedis()
+        patcher = mock.patch('orders.order_queue.get_redis_connection', return_value=self.redis_conn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeat_returns_first_order(self):
+        self.assertIsNone(claim_idempotent_order(7, 'abc', '1001'))
+        self.assertEqual(claim_idempotent_order(7, 'abc', '1002'), '1001')
+        # 不同用户的幂等键互不影响
+        self.assertIsNone(claim_idempotent_order(8, 'abc', '1003'))
+
+    def test_released_after_failure(self):
+        self.assertIsNone(claim_idempotent_order(7, 'abc', '1001'))
+        release_idempotent_order(7, 'abc')
+        self.assertIsNone(claim_idempotent_order(7, 'abc', '1002'))
+
+    def test_without_key(self):
+        self.assertIsNone(claim_idempotent_order(7, None, '1001'))
+        self.assertIsNone(claim_idempotent_order(7, None, '1002'))
+        self.assertEqual(self.redis_conn.data, {})
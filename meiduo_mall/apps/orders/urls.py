@@ -6,6 +6,8 @@ urlpatterns = [
     url(r'^orders/settlement/$', views.OrderSettlementView.as_view()),
     # 提交订单
     url(r'^orders/commit/$', views.OrderCommitView.as_view()),
+    # 查询异步下单结果
+    url(r'^orders/commit/status/$', views.OrderCommitStatusView.as_view()),
     # 提交订单成功界面
     url(r'^orders/success/$', views.OrderSuccessView.as_view()),
     # 全部订单
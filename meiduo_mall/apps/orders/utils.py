@@ -0,0 +1,100 @@
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from goods.hot_goods import incr_hot_goods
+from meiduo_mall.utils.response_code import RETCODE
+from .history import build_goods_summary
+from .inventory import confirm_reservation, release_reservation, reserve_redis_stock
+from .models import OrderInfo
+from .stock import StockError, reserve_stock, run_with_retry
+
+logger = logging.getLogger('django')
+
+
+def get_selected_cart(user_id):
+    """购物车中勾选的商品
+    :return: {sku_id: count}
+    """
+    pl = get_redis_connection('carts').pipeline()
+    pl.hgetall('carts_%s' % user_id)
+    pl.smembers('selected_%s' % user_id)
+    redis_dict, selected_ids = pl.execute()
+
+    cart_dict = {}
+    for sku_id_bytes in selected_ids:
+        if sku_id_bytes in redis_dict:
+            cart_dict[int(sku_id_bytes)] = int(redis_dict[sku_id_bytes])
+    return cart_dict
+
+
+def commit_order(order_id, user_id, address_id, pay_method, cart_dict):
+    """保存订单、扣库存, 成功后从购物车中删除下单的商品
+    同步下单的视图和异步下单的celery任务共用
+    :param cart_dict: {sku_id: 购买数量}
+    :return: (code, errmsg)
+    """
+    status = (OrderInfo.ORDER_STATUS_ENUM['UNPAID']
+              if pay_method == OrderInfo.PAY_METHODS_ENUM['ALIPAY']
+              else OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
+
+    # redis预扣库存模式下, 库存不足的请求在这里就返回, 不访问数据库
+    redis_stock = settings.INVENTORY_REDIS_MODE
+    if redis_stock:
+        try:
+            reserve_redis_stock(order_id, cart_dict)
+        except StockError:
+            return RETCODE.STOCKERR, '库存不足'
+
+    def create_order():
+        with transaction.atomic():
+            # 保存订单记录
+            order = OrderInfo.objects.create(
+                order_id=order_id,
+                user_id=user_id,
+                address_id=address_id,
+                total_count=0,
+                total_amount=Decimal('0.00'),
+                freight=Decimal('10.00'),
+                pay_method=pay_method,
+                status=status
+            )
+            # 扣库存、加销量、保存订单商品, 库存不足时抛出StockError回滚整个订单
+            skus = reserve_stock(order, cart_dict, deduct_stock=not redis_stock)
+
+            for sku_id, buy_count in cart_dict.items():
+                order.total_count += buy_count
+                order.total_amount += skus[sku_id].price * buy_count
+            order.total_amount += order.freight
+            # 我的订单页面直接读取摘要, 不再查询订单商品
+            order.goods_summary = build_goods_summary(
+                [(skus[sku_id], cart_dict[sku_id], skus[sku_id].price) for sku_id in sorted(cart_dict)])
+            order.save(update_fields=['total_count', 'total_amount', 'goods_summary'])
+        return skus
+
+    try:
+        skus = run_with_retry(create_order)
+    except Exception as e:
+        if redis_stock:
+            release_reservation(order_id)
+        if isinstance(e, StockError):
+            return RETCODE.STOCKERR, '库存不足'
+        logger.error(e)
+        return RETCODE.DBERR, '下单失败'
+
+    # 货到付款的订单不会超时取消, 预扣的库存直接确认
+    if redis_stock and status != OrderInfo.ORDER_STATUS_ENUM['UNPAID']:
+        confirm_reservation(order_id)
+
+    # 只删除下单的商品, 下单期间新加入购物车的商品保留
+    pl = get_redis_connection('carts').pipeline()
+    pl.hdel('carts_%s' % user_id, *cart_dict)
+    pl.srem('selected_%s' % user_id, *cart_dict)
+    pl.execute()
+
+    # 累加热销排行中的销量
+    incr_hot_goods([(skus[sku_id].category_id, sku_id, count) for sku_id, count in cart_dict.items()])
+    return RETCODE.OK, '下单成功'
@@ -1,20 +1,32 @@
 import json
+import time
 from decimal import Decimal
 
 from django import http
-from django.db import transaction
+from django.conf import settings
 from django.http import JsonResponse
 from django.shortcuts import render
 from django.views import View
-from django_redis import get_redis_connection
-from django.utils import timezone
 
-from goods.models import SKU, GoodsCategory
+from goods.models import GoodsCategory
+from goods.sku_cache import get_sku_summaries
 from meiduo_mall.utils.response_code import RETCODE
 from meiduo_mall.utils.views import LoginRequiredView
 from users.models import Address
-from .models import OrderInfo, OrderGoods
-from django.core.paginator import Paginator, EmptyPage
+from carts.utils import get_redis_cart, get_cart_skus
+from .comments import CommentError, clean_comments, order_goods_sku_id, save_comments
+from .history import get_order_page
+from .models import OrderInfo
+from .order_id import generate_order_id
+from .order_queue import (TICKET_DONE, TICKET_QUEUED, claim_idempotent_order, enqueue_order,
+                          get_idempotent_ticket, get_ticket, order_queue_shard, release_idempotent_order)
+from .utils import commit_order, get_selected_cart
+from celery_tasks.orders.tasks import drain_order_queue
+
+# 查询异步下单结果时最多阻塞等待的秒数
+ORDER_COMMIT_MAX_WAIT = 5
+# 同步下单重复提交时, 等待第一次提交保存订单的检查间隔(秒)
+ORDER_COMMIT_CHECK_INTERVAL = 0.2
 
 
 class OrderSettlementView(LoginRequiredView):
@@ -23,23 +35,13 @@ class OrderSettlementView(LoginRequiredView):
         addresses = Address.objects.filter(user=request.user, is_deleted=False)
         addresses = addresses if addresses.exists() else None
         user = request.user
-        redis_conn = get_redis_connection('carts')
-        redis_dict = redis_conn.hgetall('carts_%s' % user.id)
-        selected_ids = redis_conn.smembers('selected_%s' % user.id)
-
-        cart_dict = {}
-        for sku_id_bytes in selected_ids:
-            cart_dict[int(sku_id_bytes)] = int(redis_dict[sku_id_bytes])
-
-        skus = SKU.objects.filter(id__in=cart_dict.keys())
+        # 购物车中勾选的商品, sku信息来自sku摘要缓存
+        skus = get_cart_skus(get_redis_cart(user), selected_only=True)
         total_count = 0
         total_amount = Decimal('0.00')
         for sku in skus:
-            sku.count = cart_dict[sku.id]
-            sku.amount = sku.price * sku.count
-
-            total_count += sku.count
-            total_amount += sku.amount
+            total_count += sku['count']
+            total_amount += sku['amount']
 
         freight = Decimal('10.00')
         context = {
@@ -72,85 +74,70 @@ class OrderCommitView(LoginRequiredView):
             return http.HttpResponseForbidden('非法支付方式')
 
         user = request.user
-        order_id = timezone.now().strftime('%Y%m%d%H%M%S') + ('%09d' % user.id)
-
-        status = (OrderInfo.ORDER_STATUS_ENUM['UNPAID']
-                  if pay_method == OrderInfo.PAY_METHODS_ENUM['ALIPAY']
-                  else OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
-
-        with transaction.atomic():
-            # 创建事务的保存点
-            save_point = transaction.savepoint()
-            try:
-                # 保存订单记录
-                order = OrderInfo.objects.create(
-                    order_id=order_id,
-                    user=user,
-                    address=address,
-                    total_count=0,
-                    total_amount=Decimal('0.00'),
-                    freight=Decimal('10.00'),
-                    pay_method=pay_method,
-                    status=status
-                )
-
-                redis_conn = get_redis_connection('carts')
-                redis_dict = redis_conn.hgetall('carts_%s' % user.id)
-                selected_ids = redis_conn.smembers('selected_%s' % user.id)
-
-                cart_dict = {}
-                for sku_id_bytes in selected_ids:
-                    cart_dict[int(sku_id_bytes)] = int(redis_dict[sku_id_bytes])
-
-                for sku_id in cart_dict:
-                    while True:
-                        sku = SKU.objects.get(id=sku_id)
-                        buy_count = cart_dict[sku_id]
-                        origin_stock = sku.stock
-                        origin_sales = sku.sales
-
-                        if buy_count > origin_stock:
-                            transaction.savepoint_rollback(save_point)
-                            return http.JsonResponse({'code': RETCODE.STOCKERR, 'errmsg': '库存不足'})
-
-                        new_stock = origin_stock - buy_count
-                        new_sales = origin_sales + buy_count
-                        result = SKU.objects.filter(id=sku_id, stock=origin_stock).update(stock=new_stock, sales=new_sales)
-
-
-                        if result == 0:
-                            continue
-
-                        spu = sku.spu
-                        spu.sales += buy_count
-                        spu.save()
-
-                        OrderGoods.objects.create(
-                            order=order,
-                            sku=sku,
-                            count=buy_count,
-                            price=sku.price
-                        )
-                        order.total_count += buy_count
-                        order.total_amount += (sku.price * buy_count)
-                        break
-
-                order.total_amount += order.freight
-                order.save()
-
-            except Exception:
-                transaction.savepoint_rollback(save_point)
-                return http.JsonResponse({'code': RETCODE.DBERR, 'errmsg': '下单失败'})
-
-            else:
-                transaction.savepoint_commit(save_point)
-
-        pl = redis_conn.pipeline()
-        pl.hdel('carts_%s' % user.id, *selected_ids)
-        pl.delete('selected_%s' % user.id)
-        pl.execute()
-
-        return http.JsonResponse({'code': RETCODE.OK, 'errmsg': '下单成功', 'order_id': order_id})
+        idempotency_key = json_dict.get('idempotency_key')
+        if settings.ORDER_ASYNC_COMMIT:
+            # 重复提交时购物车可能已经被第一次下单清空, 先按幂等键返回之前的ticket
+            ticket = get_idempotent_ticket(user.id, idempotency_key)
+            if ticket is not None:
+                return http.JsonResponse({'code': RETCODE.OK, 'errmsg': '下单请求已提交', 'ticket': ticket})
+
+        order_id = generate_order_id(user.id)
+        if not settings.ORDER_ASYNC_COMMIT:
+            previous_order_id = claim_idempotent_order(user.id, idempotency_key, order_id)
+            if previous_order_id is not None:
+                return self._previous_order_response(user, previous_order_id)
+
+        # 购物车中勾选的商品 {sku_id: count}
+        cart_dict = get_selected_cart(user.id)
+        if not cart_dict:
+            if not settings.ORDER_ASYNC_COMMIT:
+                release_idempotent_order(user.id, idempotency_key)
+            return http.JsonResponse({'code': RETCODE.NODATAERR, 'errmsg': '没有勾选商品'})
+
+        if settings.ORDER_ASYNC_COMMIT:
+            # 异步下单: 放入队列后立即返回ticket, 浏览器用ticket查询下单结果
+            ticket, created = enqueue_order(order_id, user.id, address.id, pay_method, cart_dict, idempotency_key)
+            if created:
+                drain_order_queue.delay(order_queue_shard(user.id))
+            return http.JsonResponse({'code': RETCODE.OK, 'errmsg': '下单请求已提交', 'ticket': ticket})
+
+        code, errmsg = commit_order(order_id, user.id, address.id, pay_method, cart_dict)
+        if code != RETCODE.OK:
+            release_idempotent_order(user.id, idempotency_key)
+            return http.JsonResponse({'code': code, 'errmsg': errmsg})
+        return http.JsonResponse({'code': RETCODE.OK, 'errmsg': errmsg, 'order_id': order_id})
+
+    @staticmethod
+    def _previous_order_response(user, order_id):
+        """同一个幂等键重复提交时返回第一次提交的订单, 第一次提交还在处理中时最多等待ORDER_COMMIT_MAX_WAIT秒"""
+        deadline = time.time() + ORDER_COMMIT_MAX_WAIT
+        while True:
+            if OrderInfo.objects.filter(order_id=order_id, user=user).exists():
+                return http.JsonResponse({'code': RETCODE.OK, 'errmsg': '下单成功', 'order_id': order_id})
+            if time.time() >= deadline:
+                return http.JsonResponse({'code': RETCODE.THROTTLINGERR, 'errmsg': '订单正在提交, 请稍后在我的订单中查看'})
+            time.sleep(ORDER_COMMIT_CHECK_INTERVAL)
+
+
+class OrderCommitStatusView(LoginRequiredView):
+    """查询异步下单的结果"""
+    def get(self, request):
+        ticket = request.GET.get('ticket')
+        if not ticket:
+            return http.HttpResponseForbidden('缺少必传参数')
+        # 长轮询: 还在排队时最多等待ORDER_COMMIT_MAX_WAIT秒
+        try:
+            wait = min(max(int(request.GET.get('wait', 0)), 0), ORDER_COMMIT_MAX_WAIT)
+        except ValueError:
+            return http.HttpResponseForbidden('参数有误')
+
+        ticket_dict = get_ticket(ticket, request.user.id, wait)
+        if ticket_dict is None:
+            return http.JsonResponse({'code': RETCODE.NODATAERR, 'errmsg': '下单请求不存在'})
+        if ticket_dict['status'] == TICKET_QUEUED:
+            return http.JsonResponse({'code': RETCODE.OK, 'errmsg': '排队中', 'status': TICKET_QUEUED})
+        return http.JsonResponse({'code': ticket_dict['code'], 'errmsg': ticket_dict['errmsg'],
+                                  'status': TICKET_DONE, 'order_id': ticket_dict['order_id']})
 
 
 class OrderSuccessView(LoginRequiredView):
@@ -180,37 +167,23 @@ class GoodsOrdersView(LoginRequiredView):
     def get(self, request, page_num):
 
         user = request.user
-        # 获取当前登录用户的所有订单按时间降序排序
-        order_qs = OrderInfo.objects.filter(user=user).order_by('-create_time')
-        # 创建分页对象Paginator(要分页的所有数据, 每页显示多个条数据)
-        paginator = Paginator(order_qs, 5)
+        # 按下单时间倒序, 用上一页最后一个订单的(create_time, order_id)作为游标查询下一页
         try:
-            # 获取指定页的订单数据
-            page_orders = paginator.page(page_num)
-        except EmptyPage:
+            page_orders, prev_cursor, next_cursor = get_order_page(user, request.GET.get('cursor'))
+        except ValueError:
             return http.HttpResponseForbidden('当前页不存在')
-        # 获取总页数据
-        total_page = paginator.num_pages
-        # 获取每个order对象
+        page_num = int(page_num)
         for order in page_orders:
             # 订单支付方式
             order.pay_method_name = OrderInfo.PAY_METHOD_CHOICES[order.pay_method-1][1]
             # 订单状态
             order.status_name = OrderInfo.ORDER_STATUS_CHOICES[order.status-1][1]
-            # 获取所有当前的订单的商品
-            goods = order.skus.all()
-            # 给order增加sku_list属性
-            order.sku_list = []
-            for good in goods:
-                sku = good.sku
-                sku.count = good.count
-                sku.amount = good.price * good.count
-                order.sku_list.append(sku)
 
         context = {
-            'page_orders': page_orders,  # 分页后数据
-            'total_page': total_page,  # 总页数
+            'page_orders': page_orders,  # 当前页订单
             'page_num': page_num,  # 当前页码
+            'prev_url': '/orders/info/%d/?cursor=%s' % (page_num - 1, prev_cursor) if prev_cursor else None,
+            'next_url': '/orders/info/%d/?cursor=%s' % (page_num + 1, next_cursor) if next_cursor else None,
         }
 
         return render(request, 'user_center_order.html', context)
@@ -221,20 +194,23 @@ class OrderCommentView(LoginRequiredView):
     def get(self, request):
         order_id = request.GET.get('order_id')
         try:
-            order = OrderInfo.objects.get(order_id=order_id)
+            order = OrderInfo.objects.get(order_id=order_id, user=request.user)
         except OrderInfo.DoesNotExist:
             return http.HttpResponseForbidden('订单信息有误')
 
-        goods = order.skus.filter(is_commented=False)
+        goods = list(order.skus.filter(is_commented=False))
+        summaries = get_sku_summaries(good.sku_id for good in goods)
         skus = []
         for good in goods:
-            sku = good.sku
+            sku = summaries.get(good.sku_id)
+            if sku is None:
+                continue
             skus.append({
                 'order_id': order_id,
-                'sku.id': good.id,
-                'default_image_url': sku.default_image.url,
-                'name': sku.name,
-                'price': str(sku.price)
+                'sku_id': good.sku_id,
+                'default_image_url': sku['default_image_url'],
+                'name': sku['name'],
+                'price': sku['price']
             })
         json_skus = json.dumps(skus)
         context = {
@@ -242,53 +218,33 @@ class OrderCommentView(LoginRequiredView):
         }
         return render(request, 'goods_judge.html', context)
 
-
     def post(self, request):
+        """一次提交订单中一个或多个商品的评价
+        {'order_id': .., 'comments': [{'sku_id': .., 'comment': .., 'score': .., 'is_anonymous': ..}]}
+        """
         json_dict = json.loads(request.body.decode())
         order_id = json_dict.get('order_id')
-        sku_id = json_dict.get('sku_id')
-        comment = json_dict.get('comment')
-        score = json_dict.get('score')
-        is_anonymous = json_dict.get('is_anonymous')
-
-        if not all([order_id, sku_id, comment, score]):
+        comments = json_dict.get('comments')
+        if not order_id:
             return http.HttpResponseForbidden('缺少必传参数')
+
+        if comments is None:
+            # 兼容只评价一个商品的旧参数, 旧参数中的sku_id是订单商品的id
+            sku_id = order_goods_sku_id(order_id, request.user, json_dict.get('sku_id'))
+            if sku_id is None:
+                return http.HttpResponseForbidden('sku_id有误')
+            comments = [dict({key: json_dict.get(key) for key in ['comment', 'score', 'is_anonymous']}, sku_id=sku_id)]
         try:
-            order = OrderInfo.objects.get(order_id=order_id)
-        except OrderInfo.DoesNotExist:
-            return http.HttpResponseForbidden("缺少订单参数")
+            comments = clean_comments(comments)
+        except CommentError as e:
+            return JsonResponse({'code': RETCODE.PARAMERR, 'errmsg': str(e)})
+
         try:
-            order_good = OrderGoods.objects.get(id=sku_id)
-        except SKU.DoesNotExist as e:
-            return JsonResponse({'code': RETCODE.DBERR, 'errmsg': 'sku_id有误'})
-        # 判断is_anonymous
-        if isinstance(is_anonymous, bool) is False:
-            return JsonResponse({'code': RETCODE.DBERR, 'errmsg': 'is_anonymous参数有误'})
-
-        # 保存订单商品数据
-        order_good.comment = comment
-        order_good.score = score
-        order_good.is_anonymous = is_anonymous
-        order_good.is_commented = True
-        order_good.save()
-
-        # 增加商品sku评价数量
-        sku = order_good.sku
-        sku.comments += 1
-        sku.save()
-
-        order_goods = order.skus.all()
-        # 修改订单状态
-        order.status = OrderInfo.ORDER_STATUS_CHOICES[4][0]
-        for each_good in order_goods:
-            if not each_good.is_commented:
-                order.status = OrderInfo.ORDER_STATUS_CHOICES[3][0]
-                break
-        # 保存订单状态
-        order.save()
+            commented = save_comments(order_id, request.user, comments)
+        except OrderInfo.DoesNotExist:
+            return http.HttpResponseForbidden('订单信息有误')
 
+        if not commented:
+            return JsonResponse({'code': RETCODE.PARAMERR, 'errmsg': '商品不在订单中或已经评价过'})
         # 响应
-        return JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK'})
-
-
-
+        return JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK', 'count': len(commented)})
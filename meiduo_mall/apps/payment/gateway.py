@@ -0,0 +1,93 @@
+"""支付宝网关
+
+每个进程只创建一个网关对象: 密钥文件只读取、解析一次, 签名和验签不修改对象状态, 可以在多线程中共用
+
+settings.ALIPAY_GATEWAY 为 'stub' 时使用本地网关, 用进程内生成的密钥签名和验签, 不访问支付宝,
+用于本地测试和签名性能测试
+"""
+import base64
+import os
+import threading
+
+from alipay import AliPay
+from django.conf import settings
+
+KEYS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keys')
+APP_PRIVATE_KEY_PATH = os.path.join(KEYS_DIR, 'app_private_key.pem')
+ALIPAY_PUBLIC_KEY_PATH = os.path.join(KEYS_DIR, 'alipay_public_key.pem')
+
+
+def _read_key(path):
+    with open(path) as f:
+        return f.read()
+
+
+class AlipayGateway(object):
+    """支付宝网关"""
+
+    def __init__(self, app_private_key=None, alipay_public_key=None):
+        self.alipay = AliPay(
+            appid=settings.ALIPAY_APPID,
+            app_notify_url=getattr(settings, 'ALIPAY_NOTIFY_URL', None),
+            app_private_key_string=app_private_key or _read_key(APP_PRIVATE_KEY_PATH),
+            # 支付宝的公钥，验证支付宝回传消息使用，不是你自己的公钥
+            alipay_public_key_string=alipay_public_key or _read_key(ALIPAY_PUBLIC_KEY_PATH),
+            sign_type="RSA2",
+            debug=settings.ALIPAY_DEBUG
+        )
+
+    def page_pay_url(self, order_id, total_amount, return_url):
+        """电脑网站支付的支付宝支付界面url"""
+        order_string = self.alipay.api_alipay_trade_page_pay(
+            out_trade_no=order_id,  # 美多订单编号
+            total_amount=str(total_amount),  # 要支付的多少钱
+            subject='美多商城:%s' % order_id,  # 支付时的注题
+            return_url=return_url  # 支付成功后的回调url
+        )
+        return settings.ALIPAY_URL + '?' + order_string
+
+    def verify(self, data, sign):
+        """校验支付宝回传的参数, data中不包含sign"""
+        # sdk会修改传入的字典, 传一份副本
+        return self.alipay.verify(dict(data), sign)
+
+
+class StubAlipayGateway(AlipayGateway):
+    """本地支付网关, 不访问支付宝
+    用同一对进程内生成的密钥代替应用私钥和支付宝公钥, 可以给模拟的支付宝通知签名并通过验签
+    """
+    _stub_key = None
+
+    def __init__(self):
+        if StubAlipayGateway._stub_key is None:
+            from Cryptodome.PublicKey import RSA
+            StubAlipayGateway._stub_key = RSA.generate(2048)
+        key = StubAlipayGateway._stub_key
+        super().__init__(app_private_key=key.exportKey().decode(),
+                         alipay_public_key=key.publickey().exportKey().decode())
+
+    def sign_notification(self, data):
+        """模拟支付宝给通知参数签名(RSA2: SHA256WithRSA), 返回带sign的参数"""
+        from Cryptodome.Hash import SHA256
+        from Cryptodome.Signature import PKCS1_v1_5
+
+        message = '&'.join('%s=%s' % item for item in sorted(data.items()))
+        signature = PKCS1_v1_5.new(StubAlipayGateway._stub_key).sign(SHA256.new(message.encode()))
+        return dict(data, sign_type='RSA2', sign=base64.b64encode(signature).decode())
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """进程内共用的支付网关"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                if getattr(settings, 'ALIPAY_GATEWAY', 'alipay') == 'stub':
+                    _gateway = StubAlipayGateway()
+                else:
+                    _gateway = AlipayGateway()
+    return _gateway
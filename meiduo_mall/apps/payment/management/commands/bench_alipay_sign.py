@@ -0,0 +1,47 @@
+import os
+import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payment.gateway import AlipayGateway, StubAlipayGateway, APP_PRIVATE_KEY_PATH
+
+
+class Command(BaseCommand):
+    help = '对比每次请求创建AliPay对象和共用支付网关时生成支付链接、验签的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=500, help='每种情况执行的次数')
+        parser.add_argument('--stub', action='store_true', help='使用本地网关的密钥, 没有支付宝密钥文件时使用')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        gateway = StubAlipayGateway() if options['stub'] or not os.path.exists(APP_PRIVATE_KEY_PATH) \
+            else AlipayGateway()
+        return_url = settings.ALIPAY_RETURN_URL
+
+        if isinstance(gateway, StubAlipayGateway):
+            stub_key = StubAlipayGateway._stub_key
+            keys = (stub_key.exportKey().decode(), stub_key.publickey().exportKey().decode())
+        else:
+            keys = (None, None)
+
+        def per_request():
+            # 原来的方式: 每次请求创建AliPay对象, 读取并解析密钥
+            AlipayGateway(*keys).page_pay_url('20190101000000000000000001', '100.00', return_url)
+
+        shared = lambda: gateway.page_pay_url('20190101000000000000000001', '100.00', return_url)
+
+        self.stdout.write('%-24s %12s %12s' % ('case', 'ms/op', 'ops/s'))
+        for name, func in [('per-request client', per_request), ('shared gateway', shared)]:
+            seconds = timeit.timeit(func, number=number) / number
+            self.stdout.write('%-24s %12.3f %12.0f' % (name, seconds * 1000, 1 / seconds))
+
+        if isinstance(gateway, StubAlipayGateway):
+            # 本地网关可以给模拟的通知签名, 同时测试验签
+            notification = gateway.sign_notification({'out_trade_no': '20190101000000000000000001',
+                                                      'trade_no': 'STUB1', 'total_amount': '100.00'})
+            sign = notification.pop('sign')
+            assert gateway.verify(notification, sign)
+            seconds = timeit.timeit(lambda: gateway.verify(notification, sign), number=number) / number
+            self.stdout.write('%-24s %12.3f %12.0f' % ('shared verify', seconds * 1000, 1 / seconds))
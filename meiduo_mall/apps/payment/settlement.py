@@ -0,0 +1,132 @@
+"""支付结果入账
+
+支付宝异步通知和同步回跳都只校验签名, 入账放入redis队列由celery任务分批处理:
+每批用一条 INSERT .. ON DUPLICATE KEY UPDATE 保存支付记录, 用一条带状态条件的UPDATE修改订单状态,
+同一笔交易重复通知、通知和回跳同时到达都只入账一次
+
+payment_settlements: list 待入账的支付结果 {order_id, trade_id, total_amount}
+"""
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from meiduo_mall.utils.redis_queue import drain_queue
+from orders.inventory import confirm_reservation
+from orders.models import OrderInfo
+
+logger = logging.getLogger('django')
+
+SETTLEMENT_QUEUE_KEY = 'payment_settlements'
+# 每批入账的支付结果数量
+SETTLEMENT_BATCH_SIZE = 200
+# 处理队列的锁的过期时间(秒)
+SETTLEMENT_LOCK_EXPIRES = 60
+
+
+def clean_settlement(item):
+    """校验一条支付结果
+    :return: {'order_id', 'trade_id', 'total_amount': Decimal}, 有误时返回None
+    """
+    if not isinstance(item, dict):
+        return None
+    order_id, trade_id = item.get('order_id'), item.get('trade_id')
+    if not order_id or not trade_id or not isinstance(order_id, str) or not isinstance(trade_id, str):
+        return None
+    try:
+        total_amount = Decimal(item.get('total_amount'))
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+    if not total_amount.is_finite() or total_amount <= 0:
+        return None
+    return {'order_id': order_id, 'trade_id': trade_id, 'total_amount': total_amount}
+
+
+def enqueue_settlement(order_id, trade_id, total_amount):
+    """把验签通过的支付结果放入入账队列
+    :return: 参数有误时返回False, 不放入队列
+    """
+    item = clean_settlement({'order_id': order_id, 'trade_id': trade_id, 'total_amount': total_amount})
+    if item is None:
+        logger.error('支付结果参数有误: %s %s %s' % (order_id, trade_id, total_amount))
+        return False
+    payload = json.dumps({'order_id': order_id, 'trade_id': trade_id, 'total_amount': str(item['total_amount'])})
+    get_redis_connection('default').rpush(SETTLEMENT_QUEUE_KEY, payload)
+    return True
+
+
+def apply_settlements(settlements):
+    """批量入账, 重复的支付结果只入账一次, 参数有误的支付结果记录日志后跳过
+    :param settlements: [{'order_id', 'trade_id', 'total_amount'}]
+    :return: 本次由待支付改为待评价的订单数量
+    """
+    trades = {}
+    for item in settlements:
+        cleaned = clean_settlement(item)
+        if cleaned is None:
+            logger.error('跳过参数有误的支付结果: %r' % (item,))
+            continue
+        trades.setdefault(cleaned['order_id'], cleaned)
+    if not trades:
+        return 0
+
+    orders = dict(OrderInfo.objects.filter(order_id__in=trades).values_list('order_id', 'total_amount'))
+    rows = []
+    now = timezone.now()
+    for order_id, item in trades.items():
+        if order_id not in orders:
+            logger.error('支付结果对应的订单不存在: %s %s' % (order_id, item['trade_id']))
+        elif item['total_amount'] != orders[order_id]:
+            logger.error('支付金额与订单金额不一致: %s %s %s' % (order_id, item['trade_id'], item['total_amount']))
+        else:
+            rows.append((order_id, item['trade_id'], now, now))
+    if not rows:
+        return 0
+
+    paid_ids = [row[0] for row in rows]
+    # trade_id唯一, 已经保存过的交易不重复插入
+    sql = ('INSERT INTO tb_payment (order_id, trade_id, create_time, update_time) '
+           'VALUES (%s, %s, %s, %s) '
+           'ON DUPLICATE KEY UPDATE trade_id = trade_id')
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        # 只修改还是待支付的订单, 已经入账的订单不受影响
+        count = OrderInfo.objects.filter(order_id__in=paid_ids, status=OrderInfo.ORDER_STATUS_ENUM['UNPAID']).update(
+            status=OrderInfo.ORDER_STATUS_ENUM['UNCOMMENT'])
+        if count < len(paid_ids):
+            canceled = list(OrderInfo.objects.filter(
+                order_id__in=paid_ids, status=OrderInfo.ORDER_STATUS_ENUM['CANCELED']).values_list('order_id', flat=True))
+            if canceled:
+                # 超时取消之后才支付成功, 需要人工退款
+                logger.warning('已取消的订单支付成功, 需要退款: %s' % ', '.join(canceled))
+
+    # 已支付的订单不再超时释放库存
+    if settings.INVENTORY_REDIS_MODE:
+        for order_id in paid_ids:
+            confirm_reservation(order_id)
+    return count
+
+
+def _apply_payloads(payloads, recovered):
+    # 上次中断的一批重新入账也不会重复, 不需要区分
+    settlements = []
+    for payload in payloads:
+        try:
+            settlements.append(json.loads(payload.decode()))
+        except ValueError:
+            # 无法解析的消息不能留在队列中, 否则会一直阻塞后面的入账
+            logger.error('跳过无法解析的支付结果: %r' % payload)
+    apply_settlements(settlements)
+
+
+def settle_payments():
+    """处理入账队列中的所有支付结果, 已经有worker在处理时直接返回
+    :return: 处理的支付结果数量
+    """
+    return drain_queue(get_redis_connection('default'), SETTLEMENT_QUEUE_KEY, _apply_payloads,
+                       SETTLEMENT_BATCH_SIZE, SETTLEMENT_LOCK_EXPIRES)
@@ -8,4 +8,6 @@ urlpatterns = [
     url(r'^payment/(?P<order_id>\d+)/$', views.PaymentView.as_view()),
     # 支付成功后回调处理
     url(r'^payment/status/$', views.PaymentStatusView.as_view()),
+    # 支付宝异步通知
+    url(r'^payment/notify/$', views.PaymentNotifyView.as_view()),
 ]
\ No newline at end of file
@@ -9,6 +9,7 @@ from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 
 from goods.models import SKU
+from goods.sku_cache import get_sku_summaries
 from .models import User, Address
 from meiduo_mall.utils.response_code import RETCODE
 from celery_tasks.email.tasks import send_verify_email
@@ -24,6 +25,9 @@ from celery_tasks.sms.tasks import send_sms_code
 
 logger = logging.getLogger('django')
 
+# 浏览记录每页默认显示的商品数量
+BROWSE_HISTORY_PAGE_SIZE = 5
+
 
 class RegisterView(View):
     """用户注册"""
@@ -477,30 +481,45 @@ class UserBrowseHistory(LoginRequiredView):
         pl.lrem(key, 0, sku_id)
         # 添加到列表的开头
         pl.lpush(key, sku_id)
-        # 截取列表中的前五个元素
-        pl.ltrim(key, 0, 4)
+        # 只保留最近浏览的BROWSE_HISTORY_LENGTH个商品
+        pl.ltrim(key, 0, settings.BROWSE_HISTORY_LENGTH - 1)
         # 执行管道
         pl.execute()
 
         return http.JsonResponse({'code': RETCODE.OK, 'errms': 'OK'})
 
     def get(self, request):
+        """分页查询浏览记录 ?page=1&page_size=5"""
+        try:
+            page = int(request.GET.get('page', 1))
+            page_size = int(request.GET.get('page_size', BROWSE_HISTORY_PAGE_SIZE))
+        except ValueError:
+            return http.HttpResponseForbidden('参数有误')
+        if page < 1 or page_size < 1:
+            return http.HttpResponseForbidden('参数有误')
+        page_size = min(page_size, settings.BROWSE_HISTORY_LENGTH)
 
         user = request.user
+        key = 'history_%s' % user.id
+        start = (page - 1) * page_size
         redis_conn = get_redis_connection('history')
-        sku_ids = redis_conn.lrange('history_%s' % user.id, 0, -1)
-        skus = []
-
-        for sku_id in sku_ids:
-            sku_model = SKU.objects.get(id=sku_id)
-            skus.append({
-                'id': sku_model.id,
-                'name': sku_model.name,
-                'default_image_url': sku_model.default_image.url,
-                'price': sku_model.price
-            })
-
-        return http.JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK', 'skus': skus})
+        pl = redis_conn.pipeline(transaction=False)
+        pl.lrange(key, start, start + page_size - 1)
+        pl.llen(key)
+        sku_ids, total_count = pl.execute()
+
+        sku_ids = [int(sku_id) for sku_id in sku_ids]
+        # 批量读取sku摘要, 按浏览顺序返回
+        summaries = get_sku_summaries(sku_ids)
+        skus = [summaries[sku_id] for sku_id in sku_ids if sku_id in summaries]
+
+        return http.JsonResponse({
+            'code': RETCODE.OK,
+            'errmsg': 'OK',
+            'skus': skus,
+            'page': page,
+            'total_page': (total_count + page_size - 1) // page_size
+        })
 
 
 class FindPasswordView(View):
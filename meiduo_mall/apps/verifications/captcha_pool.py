@@ -0,0 +1,84 @@
+"""预生成的图形验证码
+
+生成一张验证码需要几十毫秒cpu, 由celery任务预先生成放入redis列表, 请求图形验证码时只取出一张,
+列表为空时才在请求中同步生成
+
+image_code_pool: list 预生成的验证码, 每项为 验证码文字 + '\n' + 图片内容
+image_code_pool_refilling: 已经触发补充任务的标记, 避免每个请求都触发
+"""
+import logging
+
+from django_redis import get_redis_connection
+
+from celery_tasks.captcha.tasks import fill_captcha_pool as fill_captcha_pool_task
+from meiduo_mall.libs.captcha.captcha import captcha
+from . import constants
+
+logger = logging.getLogger('django')
+
+POOL_KEY = 'image_code_pool'
+REFILLING_KEY = 'image_code_pool_refilling'
+# 补充时每次写入redis的数量
+FILL_CHUNK_SIZE = 50
+
+
+def _pack(text, image):
+    return text.encode() + b'\n' + image
+
+
+def _unpack(item):
+    text, image = item.split(b'\n', 1)
+    return text.decode(), image
+
+
+def pop_captcha():
+    """取出一张验证码, 没有预生成的验证码时同步生成
+    :return: (验证码文字, 图片内容)
+    """
+    redis_conn = get_redis_connection('verify_code')
+    pl = redis_conn.pipeline()
+    pl.lpop(POOL_KEY)
+    pl.llen(POOL_KEY)
+    item, remaining = pl.execute()
+
+    if remaining < constants.IMAGE_CODE_POOL_LOW:
+        _trigger_refill(redis_conn)
+    if item is None:
+        name, text, image = captcha.generate_captcha()
+        return text, image
+    return _unpack(item)
+
+
+def _trigger_refill(redis_conn):
+    # 任务执行期间不再重复触发, 任务丢失时标记过期后可以再次触发
+    if not redis_conn.set(REFILLING_KEY, 1, nx=True, ex=60):
+        return
+    try:
+        fill_captcha_pool_task.delay()
+    except Exception as e:
+        logger.error('触发补充图形验证码失败: %s' % e)
+
+
+def fill_captcha_pool(size=constants.IMAGE_CODE_POOL_SIZE):
+    """把预生成的验证码补充到size张
+    :return: 生成的数量
+    """
+    redis_conn = get_redis_connection('verify_code')
+    count = 0
+    try:
+        missing = size - redis_conn.llen(POOL_KEY)
+        while missing > 0:
+            items = []
+            for _ in range(min(missing, FILL_CHUNK_SIZE)):
+                name, text, image = captcha.generate_captcha()
+                items.append(_pack(text, image))
+            pl = redis_conn.pipeline()
+            pl.rpush(POOL_KEY, *items)
+            # 一段时间没有补充时整个列表过期, 不会一直使用很久以前生成的验证码
+            pl.expire(POOL_KEY, constants.IMAGE_CODE_POOL_EXPIRES)
+            pl.execute()
+            count += len(items)
+            missing -= len(items)
+    finally:
+        redis_conn.delete(REFILLING_KEY)
+    return count
@@ -1 +1,5 @@
-SMS_CODE_REDIS_EXPIRES = 300  # 短信验证码的过期时间单位秒
\ No newline at end of file
+SMS_CODE_REDIS_EXPIRES = 300  # 短信验证码的过期时间单位秒
+IMAGE_CODE_REDIS_EXPIRES = 300  # 图形验证码的过期时间单位秒
+IMAGE_CODE_POOL_SIZE = 500  # 预先生成的图形验证码数量
+IMAGE_CODE_POOL_LOW = 200  # 预生成的图形验证码少于此数量时补充
+IMAGE_CODE_POOL_EXPIRES = 3600  # 预生成的图形验证码最多保存的时间单位秒, 超过后整体换新
@@ -0,0 +1,42 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from meiduo_mall.libs.captcha.captcha import Captcha
+
+
+class Command(BaseCommand):
+    help = '对比重新加载字体、缓存字体以及不同图片格式时生成图形验证码的速度和图片大小'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=300, help='每种方式生成的数量')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        pil_captcha = Captcha()
+
+        def reload_fonts():
+            # 字体缓存之前的实现: 每次都重新加载字体, 输出JPEG
+            pil_captcha._fonts.clear()
+            pil_captcha.initialize()
+            return pil_captcha.captcha('', fmt='JPEG')
+
+        def generate(fmt, compress_level=Captcha.PNG_COMPRESS_LEVEL):
+            def func():
+                pil_captcha.PNG_COMPRESS_LEVEL = compress_level
+                pil_captcha.initialize()
+                return pil_captcha.captcha('', fmt=fmt)
+            return func
+
+        cases = [
+            ('reload fonts jpeg', reload_fonts),
+            ('cached fonts jpeg', generate('JPEG')),
+            # PIL默认的PNG压缩级别
+            ('png level 6', generate('PNG', 6)),
+            ('png level %d' % Captcha.PNG_COMPRESS_LEVEL, generate('PNG')),
+        ]
+        self.stdout.write('%-20s %10s %12s %12s' % ('case', 'ms/op', 'captchas/s', 'bytes'))
+        for name, func in cases:
+            size = len(func()[2])
+            seconds = timeit.timeit(func, number=number) / number
+            self.stdout.write('%-20s %10.2f %12.0f %12d' % (name, seconds * 1000, 1 / seconds, size))
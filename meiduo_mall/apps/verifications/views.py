@@ -2,10 +2,10 @@ from django.views import View
 from django import http
 from django_redis import get_redis_connection
 import logging
-from meiduo_mall.libs.captcha.captcha import captcha
 from meiduo_mall.utils.response_code import RETCODE
 from random import randint
 from . import constants
+from .captcha_pool import pop_captcha
 from celery_tasks.sms.tasks import send_sms_code
 
 
@@ -18,9 +18,10 @@ class ImageCodeView(View):
 
     def get(self, request, uuid):
 
-        name, text, image = captcha.generate_captcha()
+        # 取出一张预生成的验证码, 把文字和uuid绑定
+        text, image = pop_captcha()
         redis_conn = get_redis_connection('verify_code')
-        redis_conn.setex('img_%s' % uuid, 300, text)
+        redis_conn.setex('img_%s' % uuid, constants.IMAGE_CODE_REDIS_EXPIRES, text)
 
         return http.HttpResponse(image, content_type='image/png')
 
@@ -55,9 +55,14 @@ class Bezier:
 
 
 class Captcha(object):
+    # PNG的压缩级别, 验证码图片很小, 1级压缩比默认的6级体积大一些, 编码时间约为一半
+    PNG_COMPRESS_LEVEL = 1
+
     def __init__(self):
         self._bezier = Bezier()
         self._dir = os.path.dirname(__file__)
+        # 已加载的字体 {(字体文件, 字号): FreeTypeFont}, 每个字体只读取一次
+        self._fonts = {}
         # self._captcha_path = os.path.join(self._dir, '..', 'static', 'captcha')
 
     @staticmethod
@@ -120,9 +125,15 @@ class Captcha(object):
             draw.line(((x, y), (x + level, y)), fill=color if color else self._color, width=level)
         return image
 
+    def truetype(self, name, size):
+        key = (name, size)
+        if key not in self._fonts:
+            self._fonts[key] = truetype(name, size)
+        return self._fonts[key]
+
     def text(self, image, fonts, font_sizes=None, drawings=None, squeeze_factor=0.75, color=None):
         color = color if color else self._color
-        fonts = tuple([truetype(name, size)
+        fonts = tuple([self.truetype(name, size)
                        for name in fonts
                        for size in font_sizes or (65, 70, 75)])
         draw = Draw(image)
@@ -187,7 +198,7 @@ class Captcha(object):
         return image.rotate(
             random.uniform(-angle, angle), Image.BILINEAR, expand=1)
 
-    def captcha(self, path=None, fmt='JPEG'):
+    def captcha(self, path=None, fmt='PNG'):
         """Create a captcha.
 
         Args:
@@ -207,10 +218,11 @@ class Captcha(object):
         image = self.smooth(image)
         name = "".join(random.sample(string.ascii_lowercase + string.ascii_uppercase + '3456789', 24))
         text = "".join(self._text)
+        params = {'compress_level': self.PNG_COMPRESS_LEVEL} if fmt == 'PNG' else {}
         out = BytesIO()
-        image.save(out, format=fmt)
+        image.save(out, format=fmt, **params)
         if path:
-            image.save(os.path.join(path, name), fmt)
+            image.save(os.path.join(path, name), fmt, **params)
         return name, text, out.getvalue()
 
     def generate_captcha(self):
@@ -178,6 +178,13 @@ CACHES = {
                 "CLIENT_CLASS": "django_redis.client.DefaultClient",
             }
         },
+    "inventory": { # 库存预扣
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": "redis://127.0.0.1:6379/5",
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            }
+        },
 }
 
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
@@ -265,11 +272,36 @@ HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
 # 搜索出来的商品每页显示多少条
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 5
 
+# 登录时cookie购物车合并到redis的策略: overwrite 以cookie中的数量为准, add 数量相加, max 取较大的数量
+CART_MERGE_POLICY = 'overwrite'
+
+# 每个用户保留的浏览记录数量
+BROWSE_HISTORY_LENGTH = 5
+
+# 商品列表使用(排序字段, id)定位分页, 关闭时使用Paginator的COUNT + OFFSET分页
+GOODS_LIST_KEYSET_PAGINATION = True
+
+# 下单时先在redis中预扣库存, 再由celery任务批量同步到数据库, 开启前先执行 python manage.py sync_redis_stock
+INVENTORY_REDIS_MODE = False
+# 未支付订单的库存保留时间(秒), 超时后取消订单并释放库存
+ORDER_UNPAID_EXPIRES = 30 * 60
+
+# 提交订单时只放入队列并返回ticket, 由celery任务分批保存订单
+ORDER_ASYNC_COMMIT = False
+# 下单队列的分片数, 同一用户的订单总在同一分片中按顺序处理, 也是异步下单时数据库的并发上限
+ORDER_QUEUE_SHARDS = 4
+
+# 订单号中的机器号(0-999)按进程分配: 优先使用环境变量 ORDER_ID_WORKER_ID, 否则从redis租用, 见 orders.order_id
+
 # 支付宝
 ALIPAY_APPID = '2016093000629392'
 ALIPAY_DEBUG = True  # 表示是沙箱环境还是真实支付环境
 ALIPAY_URL = 'https://openapi.alipaydev.com/gateway.do'
 ALIPAY_RETURN_URL = 'http://www.meiduo.site:8000/payment/status/'
+# 支付宝服务器异步通知支付结果的地址, 需要外网可以访问
+ALIPAY_NOTIFY_URL = 'http://www.meiduo.site:8000/payment/notify/'
+# 支付网关: alipay 支付宝, stub 本地模拟网关(不访问支付宝, 用于本地测试和性能测试)
+ALIPAY_GATEWAY = 'alipay'
 
 # ALIPAY_APPID = '2016091900551154'
 # ALIPAY_DEBUG = True  # 表示是沙箱环境还是真实支付环境
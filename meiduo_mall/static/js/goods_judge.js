@@ -37,40 +37,56 @@ var vm = new Vue({
         on_stars_click(index, score) {
             this.skus[index].final_score = score;
         },
-        // 保存评价信息
+        // 保存一个商品的评价
         save_comment(index){
             var sku = this.skus[index];
             if (sku.comment.length < 5){
                 alert('请填写多余5个字的评价内容');
             } else {
-                var url = this.host + '/orders/comment/';
-                axios.post(url, {
-                        order_id: sku.order_id,
+                this.post_comments(sku.order_id, [sku]);
+            }
+        },
+        // 一次保存所有已填写的评价
+        save_all_comments(){
+            var skus = this.skus.filter(sku => sku.comment.length >= 5);
+            if (skus.length == 0){
+                alert('请填写多余5个字的评价内容');
+            } else {
+                this.post_comments(skus[0].order_id, skus);
+            }
+        },
+        post_comments(order_id, skus){
+            var url = this.host + '/orders/comment/';
+            axios.post(url, {
+                    order_id: order_id,
+                    comments: skus.map(sku => ({
                         sku_id: sku.sku_id,
                         comment: sku.comment,
                         score: sku.final_score,
                         is_anonymous: sku.is_anonymous,
-                    }, {
-                        headers: {
-                            'X-CSRFToken':getCookie('csrftoken')
-                        },
-                        responseType: 'json'
-                    })
-                    .then(response => {
-                        if (response.data.code == '0') {
-                            // 删除评价后的商品
-                            this.skus.splice(index, 1);
-                            location.href= '/orders/info/1/'
-                        } else if (response.data.code == '4101') {
-                            location.href = '/login/?next=/orders/comment/';
-                        } else {
-                            alert(response.data.errmsg);
+                    })),
+                }, {
+                    headers: {
+                        'X-CSRFToken':getCookie('csrftoken')
+                    },
+                    responseType: 'json'
+                })
+                .then(response => {
+                    if (response.data.code == '0') {
+                        // 删除评价后的商品
+                        this.skus = this.skus.filter(sku => skus.indexOf(sku) < 0);
+                        if (this.skus.length == 0) {
+                            location.href= '/orders/info/1/';
                         }
-                    })
-                    .catch(error => {
-                        console.log(error.response);
-                    })
-            }
+                    } else if (response.data.code == '4101') {
+                        location.href = '/login/?next=/orders/comment/';
+                    } else {
+                        alert(response.data.errmsg);
+                    }
+                })
+                .catch(error => {
+                    console.log(error.response);
+                })
         }
     }
 });
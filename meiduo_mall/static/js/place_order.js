@@ -8,6 +8,8 @@ var vm = new Vue({
         pay_method: 2, // 支付方式,默认支付宝支付
         nowsite: '', // 默认地址
         payment_amount: '',
+        // 幂等键, 重复提交同一个订单时后端返回同一个下单请求
+        idempotency_key: Date.now().toString(36) + Math.random().toString(36).substr(2),
     },
     mounted(){
         // 初始化
@@ -31,7 +33,8 @@ var vm = new Vue({
                 var url = this.host + '/orders/commit/';
                 axios.post(url, {
                         address_id: this.nowsite,
-                        pay_method: this.pay_method
+                        pay_method: this.pay_method,
+                        idempotency_key: this.idempotency_key
                     }, {
                         headers:{
                             'X-CSRFToken':getCookie('csrftoken')
@@ -39,14 +42,11 @@ var vm = new Vue({
                         responseType: 'json'
                     })
                     .then(response => {
-                        if (response.data.code == '0') {
-                            location.href = '/orders/success/?order_id='+response.data.order_id
-                                        +'&payment_amount='+this.payment_amount
-                                        +'&pay_method='+this.pay_method;
-                        } else if (response.data.code == '4101') {
-                            location.href = '/login/?next=/orders/settlement/';
+                        if (response.data.code == '0' && response.data.ticket) {
+                            // 异步下单, 轮询下单结果
+                            this.poll_order_status(response.data.ticket);
                         } else {
-                            alert(response.data.errmsg);
+                            this.handle_commit_result(response.data);
                         }
                     })
                     .catch(error => {
@@ -54,6 +54,41 @@ var vm = new Vue({
                         console.log(error.response);
                     })
             }
+        },
+        // 查询异步下单的结果, 还在排队时后端最多等待5秒再返回
+        poll_order_status(ticket){
+            var url = this.host + '/orders/commit/status/?ticket=' + ticket + '&wait=5';
+            axios.get(url, {
+                    responseType: 'json'
+                })
+                .then(response => {
+                    if (response.data.code == '0' && response.data.status == 'queued') {
+                        this.poll_order_status(ticket);
+                    } else {
+                        this.handle_commit_result(response.data);
+                    }
+                })
+                .catch(error => {
+                    // 网络错误时稍后重试
+                    console.log(error.response);
+                    setTimeout(() => {
+                        this.poll_order_status(ticket);
+                    }, 1000);
+                })
+        },
+        handle_commit_result(data){
+            if (data.code == '0') {
+                location.href = '/orders/success/?order_id='+data.order_id
+                            +'&payment_amount='+this.payment_amount
+                            +'&pay_method='+this.pay_method;
+            } else if (data.code == '4101') {
+                location.href = '/login/?next=/orders/settlement/';
+            } else {
+                // 下单失败后重新提交是一个新的订单
+                this.idempotency_key = Date.now().toString(36) + Math.random().toString(36).substr(2);
+                this.order_submitting = false;
+                alert(data.errmsg);
+            }
         }
     }
 });
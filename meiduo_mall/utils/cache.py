@@ -0,0 +1,25 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_cache_version(key):
+    """获取缓存数据的版本号, 不存在时初始化一个"""
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        # 并发初始化时以先写入的为准
+        if not cache.add(key, version, None):
+            version = cache.get(key) or version
+    return version
+
+
+def incr_cache_version(key):
+    """版本号加1, 使旧版本的缓存数据全部失效"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # 版本号被清除时用当前毫秒时间戳重新开始, 避免与旧版本号重复
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
@@ -0,0 +1,66 @@
+"""redis列表实现的批处理队列
+
+<queue>: list 待处理的消息
+<queue>_processing: 正在处理的一批消息, worker中断时下次先处理这一批
+<queue>_lock: 同一个队列同时只有一个worker处理
+"""
+import uuid
+
+# KEYS[1]: 队列  KEYS[2]: 正在处理的一批  ARGV[1]: 每批数量
+# 上次处理中断时返回中断的那一批, 否则从队列头部取出一批
+TAKE_BATCH_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 1 then
+    return redis.call('lrange', KEYS[2], 0, -1)
+end
+local items = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items == 0 then
+    return items
+end
+redis.call('ltrim', KEYS[1], #items, -1)
+redis.call('rpush', KEYS[2], unpack(items))
+return items
+"""
+
+# 只释放自己加的锁
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def drain_queue(redis_conn, queue_key, handler, batch_size, lock_expires=60):
+    """分批处理队列中的所有消息, 已经有worker在处理时直接返回
+    :param handler: handler(消息列表, 是否是上次中断的一批), 正常返回后这一批才从队列中删除
+    :param lock_expires: 锁的过期时间(秒), 每处理完一批续期一次
+    :return: 处理的消息数量
+    """
+    processing_key = '%s_processing' % queue_key
+    lock_key = '%s_lock' % queue_key
+    take_batch = redis_conn.register_script(TAKE_BATCH_SCRIPT)
+    release_lock = redis_conn.register_script(RELEASE_LOCK_SCRIPT)
+
+    count = 0
+    while True:
+        token = uuid.uuid4().hex
+        if not redis_conn.set(lock_key, token, nx=True, ex=lock_expires):
+            return count
+        try:
+            recovered = bool(redis_conn.exists(processing_key))
+            while True:
+                payloads = take_batch(keys=[queue_key, processing_key], args=[batch_size])
+                if not payloads:
+                    break
+                handler(payloads, recovered)
+                recovered = False
+                count += len(payloads)
+                pl = redis_conn.pipeline()
+                pl.delete(processing_key)
+                pl.expire(lock_key, lock_expires)
+                pl.execute()
+        finally:
+            release_lock(keys=[lock_key], args=[token])
+        # 释放锁之前放入队列的消息, 它触发的任务可能因为拿不到锁已经返回了
+        if not redis_conn.llen(queue_key):
+            return count
@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+
+def write_static_file(file_path, content):
+    """先写入同目录下的临时文件再重命名, 保证nginx不会读到写了一半的文件"""
+    dir_name = os.path.dirname(file_path)
+    fd, temp_path = tempfile.mkstemp(dir=dir_name, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        # mkstemp创建的文件权限是600, 改成nginx可读
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, file_path)
+    except Exception:
+        os.remove(temp_path)
+        raise